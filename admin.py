@@ -1,14 +1,31 @@
 from django.contrib import admin
-from mpi_intranet.events.models import (Event, InternalReservation,
+from mpi_intranet.events.models import (Event, Reservation, InternalReservation,
                                         ExternalReservation, Attachment,
-                                        Location, EventType, Speaker)
+                                        Location, EventType, Speaker,
+                                        Notification, EventSeries)
 from reversion import VersionAdmin
+from django.utils import timezone
 from django.utils.html import format_html, format_html_join
-from datetime import datetime
+from datetime import datetime, time, timedelta
 from django.utils.safestring import mark_safe
 from django.core.urlresolvers import reverse
+from django.core.exceptions import PermissionDenied
 from django.contrib import messages
 from django import forms
+from django.conf.urls import patterns, url
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.core.paginator import InvalidPage, Paginator
+from django.shortcuts import get_object_or_404, redirect, render
+from django.forms.models import BaseInlineFormSet
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR, SEARCH_VAR
+from mpi_intranet.events.caching import get_cached
+from mpi_intranet.events.conflicts import booked_events, find_conflicts, room_conflicts
+from mpi_intranet.events.exports import FORMATS, participant_rows
+from mpi_intranet.events.occupancy import OPENING_HOURS, aware, find_free_slot, local, week_occupancy
+from mpi_intranet.events.pagination import EstimatedCountPaginator, fast_count
+from mpi_intranet.events.reservations import deletion_preview, import_reservations, read_casy_refs
+from mpi_intranet.events.search import search_events
+from mpi_intranet.events.series import get_occurrence, occurrences
 
 
 class YearListFilter(admin.SimpleListFilter):
@@ -16,12 +33,9 @@ class YearListFilter(admin.SimpleListFilter):
     parameter_name = 'year'
 
     def lookups(self, request, model_admin):
-        events = Event.objects.all()\
-            .values('start_date')\
-            .extra(select={'year': 'EXTRACT(year FROM start_date)'})\
-            .values('year').distinct()
-        return ((int(event['year']), unicode(int(event['year'])), )
-                for event in events)
+        years = get_cached('events', 'years', lambda: [
+            start_date.year for start_date in Event.objects.datetimes('start_date', 'year')])
+        return ((year, unicode(year), ) for year in years)
 
     def queryset(self, request, queryset):
         if self.value():
@@ -83,12 +97,13 @@ class LocationListFilter(admin.SimpleListFilter):
     parameter_name = 'location'
 
     def lookups(self, request, model_admin):
-        locations = Event.objects.filter(
-            is_inhouse=False).values('location_name_ext').distinct()
+        locations = get_cached('events', 'external_locations', lambda: list(
+            Event.objects.filter(is_inhouse=False)
+            .values_list('location_name_ext', flat=True)
+            .order_by('location_name_ext').distinct()))
         location_list = ((None, 'All'), ('internal', 'MPI'), )
         for location in locations:
-            location_list += ((location['location_name_ext'],
-                               location['location_name_ext'], ), )
+            location_list += ((location, location, ), )
         return location_list
 
     def choices(self, cl):
@@ -107,34 +122,36 @@ class LocationListFilter(admin.SimpleListFilter):
                                    location_name_ext=self.value())
 
 
-class EventInternalReservationInline(admin.TabularInline):
-    model = InternalReservation
-    exclude = ('comment', )
-    readonly_fields = ('edit_details', )
-    extra = 0
+class ReservationInlineFormSet(BaseInlineFormSet):
+    """
+    Internal and external reservations share the 'event' relation, keep their
+    formset prefixes apart
+    """
 
-    def edit_details(self, obj):
-        if not obj.id:
-            return ''
-        return mark_safe(
-            "<a href='%s' onclick='return showAddAnotherPopup(this);'>"
-            "Details</a>" % reverse('admin:events_internalreservation_change',
-                                    args=[obj.id]))
+    @classmethod
+    def get_default_prefix(cls):
+        return '%s_reservations' % cls.model.default_kind
 
 
-class EventExternalReservationInline(admin.TabularInline):
-    model = ExternalReservation
+class ReservationInline(admin.TabularInline):
+    """
+    Only adds reservations, the existing ones are listed page by page on
+    demand, see EventAdmin.reservations_view
+    """
+    formset = ReservationInlineFormSet
     exclude = ('comment', )
-    readonly_fields = ('edit_details', )
     extra = 0
 
-    def edit_details(self, obj):
-        if not obj.id:
-            return ''
-        return mark_safe(
-            "<a href='%s' onclick='return showAddAnotherPopup(this);'>"
-            "Details</a>" % reverse('admin:events_externalreservation_change',
-                                    args=[obj.id]))
+    def get_queryset(self, request):
+        return super(ReservationInline, self).get_queryset(request).none()
+
+
+class EventInternalReservationInline(ReservationInline):
+    model = InternalReservation
+
+
+class EventExternalReservationInline(ReservationInline):
+    model = ExternalReservation
 
 
 class AttachmentReservationInline(admin.TabularInline):
@@ -159,6 +176,10 @@ class EventAdminForm(forms.ModelForm):
     """
     model = Event
 
+    # Save even if the room is booked by another event at the same time
+    allow_double_booking = forms.BooleanField(
+        required=False, help_text='Save even if the room is booked by another event at the same time')
+
     def clean(self):
         if self.cleaned_data['is_inhouse']:
             if not self.cleaned_data['location_name_int']:
@@ -183,9 +204,38 @@ class EventAdminForm(forms.ModelForm):
                     'start_date': ['Cannot be ahead of end date'],
                     'end_date': ['Cannot be beyond of start date']
                 })
+        if self.cleaned_data.get('is_active') and self.cleaned_data['is_inhouse'] and \
+           self.cleaned_data.get('location_name_int') and \
+           self.cleaned_data.get('start_date') and self.cleaned_data.get('end_date') and \
+           not self.cleaned_data.get('allow_double_booking'):
+            conflicts = room_conflicts(self.cleaned_data['location_name_int'].pk,
+                                       self.cleaned_data['start_date'], self.cleaned_data['end_date'],
+                                       exclude_pk=self.instance.pk)[:10]
+            if conflicts:
+                raise forms.ValidationError({
+                    'location_name_int': ['Already booked by %s (%s - %s)' % (
+                        event.title, event.start_date.strftime('%Y-%m-%d %H:%M'),
+                        event.end_date.strftime('%Y-%m-%d %H:%M')) for event in conflicts],
+                    'allow_double_booking': ['Check to book the room anyway'],
+                })
         return super(EventAdminForm, self).clean()
 
 
+# Reservations listed per page on the event change form
+RESERVATIONS_PER_PAGE = 50
+
+# Reservation list filters of the event change form
+RESERVATION_STATUSES = {
+    'confirmed': True,
+    'waiting': False,
+}
+
+
+class ImportReservationsForm(forms.Form):
+    kind = forms.ChoiceField(choices=Reservation.KIND_CHOICES)
+    file = forms.FileField(label='CSV file')
+
+
 @admin.register(Event)
 class EventAdmin(VersionAdmin):
     model = Event
@@ -197,60 +247,50 @@ class EventAdmin(VersionAdmin):
             'end_date', 'person_in_charge', 'is_inhouse', 'location_name_int',
             'location_name_ext', 'location_building_ext', 'location_room_ext',
             'location_contact_ext', 'short_description', 'full_description',
-            'notes', 'casy_ref', 'seats_available', 'seats_for_internals_only'
+            'notes', 'casy_ref', 'seats_available', 'seats_for_internals_only',
+            'allow_double_booking'
         ]}),
     ]
     list_display = ['is_active', 'get_date', 'type', 'title',
                     'person_in_charge', 'get_speakers', 'get_location',
                     'get_room', 'get_remark', 'get_casymir_project', 'get_info']
 
-    search_fields = ['title', 'topic', 'short_description', 'full_description']
+    search_fields = ['search_document']
     list_filter = [YearListFilter, 'type', TimeListFilter, LocationListFilter,
                    ActiveListFilter]
     list_display_links = ['title']
     inlines = [EventInternalReservationInline, EventExternalReservationInline,
                AttachmentReservationInline]
     save_as = True
+    actions = ['export_participants_csv', 'export_participants_xml']
 
     def get_queryset(self, request):
         """
-        Here we introduce custom sortable columns:
-        1. Location name
-        2. Room name
-        3. Remarks existence
-        TODO: replace with conditional annotations after the project will be
-              upgraded to Django 1.8.x
+        Type and inhouse location are joined, speakers prefetched and the free
+        seats annotated, so the number of queries doesn't depend on the
+        number of rows displayed.
         """
         qs = super(EventAdmin, self).get_queryset(request)
-        qs = qs\
-            .extra(select={
-                'location_name': """
-                    CASE is_inhouse
-                        WHEN TRUE THEN 'MPI'
-                        ELSE location_name_ext
-                    END
-                """
-            })\
-            .extra(select={
-                'room_name': """
-                    CASE is_inhouse
-                        WHEN TRUE THEN (
-                            SELECT name FROM events_location
-                                WHERE events_location.id=location_name_int_id)
-                        ELSE location_room_ext
-                    END
-                """
-            })\
-            .extra(select={
-                'remarks_existence': """
-                    CASE notes
-                        WHEN '' THEN FALSE
-                        WHEN NULL THEN FALSE
-                        ELSE TRUE
-                    END
-                """
-            })
-        return qs
+        return qs\
+            .with_capacity()\
+            .select_related('type', 'location_name_int')\
+            .prefetch_related('speakers')
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Full-text search over the search documents, see search.search_events
+        """
+        if not search_term:
+            return queryset, False
+        return search_events(queryset, search_term), False
+
+    def get_ordering(self, request):
+        """
+        Search results are ordered by rank unless sorted by a column
+        """
+        if request.GET.get(SEARCH_VAR) and ORDER_VAR not in request.GET:
+            return ['-search_rank']
+        return super(EventAdmin, self).get_ordering(request)
 
     def get_date(self, obj):
         """
@@ -282,7 +322,7 @@ class EventAdmin(VersionAdmin):
         else:
             return obj.location_name_ext
     get_location.short_description = 'Location'
-    get_location.admin_order_field = 'location_name'
+    get_location.admin_order_field = 'location_sort'
 
     def get_room(self, obj):
         """
@@ -293,7 +333,7 @@ class EventAdmin(VersionAdmin):
         else:
             return obj.location_room_ext
     get_room.short_description = 'Room'
-    get_room.admin_order_field = 'room_name'
+    get_room.admin_order_field = 'room_sort'
 
     def get_remark(self, obj):
         """
@@ -302,7 +342,7 @@ class EventAdmin(VersionAdmin):
         return True if obj.notes else False
     get_remark.short_description = 'Remark'
     get_remark.boolean = True
-    get_remark.admin_order_field = 'remarks_existence'
+    get_remark.admin_order_field = 'has_notes'
 
     def get_casymir_project(self, obj):
         """
@@ -328,6 +368,134 @@ class EventAdmin(VersionAdmin):
     get_info.short_description = 'Info'
     get_info.allow_tags = True
 
+    def get_urls(self):
+        return patterns(
+            '',
+            url(r'^conflicts/$',
+                self.admin_site.admin_view(self.conflicts_view),
+                name='events_event_conflicts'),
+            url(r'^(\d+)/import_reservations/$',
+                self.admin_site.admin_view(self.import_reservations_view),
+                name='events_event_import_reservations'),
+            url(r'^(\d+)/participants\.(csv|xml)$',
+                self.admin_site.admin_view(self.participants_view),
+                name='events_event_participants'),
+            url(r'^(\d+)/reservations/(internal|external)/$',
+                self.admin_site.admin_view(self.reservations_view),
+                name='events_event_reservations'),
+            url(r'^(\d+)/deletion_preview/$',
+                self.admin_site.admin_view(self.deletion_preview_view),
+                name='events_event_deletion_preview'),
+        ) + super(EventAdmin, self).get_urls()
+
+    @staticmethod
+    def participants_response(event_ids, export_format, filename):
+        """
+        Streaming export of the participants of the events
+        """
+        lines, content_type, extension = FORMATS[export_format]
+        response = StreamingHttpResponse(lines(participant_rows(event_ids)), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (filename, extension)
+        return response
+
+    def participants_view(self, request, object_id, export_format):
+        """
+        Participant list of the event
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        if not Event.objects.filter(pk=object_id).exists():
+            raise Http404
+        return self.participants_response([object_id], export_format, 'participants-%s' % object_id)
+
+    def reservations_view(self, request, object_id, kind):
+        """
+        One page of the reservations of the event, optionally only the
+        'confirmed' or 'waiting' ones
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        if not Event.objects.filter(pk=object_id).exists():
+            raise Http404
+        queryset = Reservation.objects.filter(event=object_id, kind=kind).order_by('id')
+        status = request.GET.get('status')
+        if status in RESERVATION_STATUSES:
+            queryset = queryset.filter(is_confirmed=RESERVATION_STATUSES[status])
+        paginator = Paginator(queryset.values_list('id', 'casy_ref', 'is_confirmed'),
+                              RESERVATIONS_PER_PAGE)
+        try:
+            page = paginator.page(request.GET.get('page', 1))
+        except InvalidPage:
+            raise Http404
+        url_name = 'admin:events_%sreservation_change' % kind
+        return JsonResponse({
+            'count': paginator.count,
+            'page': page.number,
+            'num_pages': paginator.num_pages,
+            'results': [{
+                'casy_ref': casy_ref,
+                'is_confirmed': is_confirmed,
+                'url': reverse(url_name, args=[pk]),
+            } for pk, casy_ref, is_confirmed in page],
+        })
+
+    def deletion_preview_view(self, request, object_id):
+        """
+        Reservations deleted when the type of the event is changed to the
+        'type' parameter, see reservations.deletion_preview
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        event = get_object_or_404(Event, pk=object_id)
+        try:
+            event_type = EventType.objects.get(pk=request.GET.get('type'))
+        except (EventType.DoesNotExist, ValueError):
+            raise Http404
+        return JsonResponse(deletion_preview(event, event_type))
+
+    def conflicts_view(self, request):
+        """
+        Events booking the same room at the same time, upcoming ones unless
+        'all' is given
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        events = booked_events()
+        if 'all' not in request.GET:
+            events = events.filter(end_date__gte=timezone.now())
+        return render(request, 'admin/events/conflicts.html', {
+            'conflicts': find_conflicts(events), 'opts': self.model._meta,
+            'show_all': 'all' in request.GET})
+
+    def export_participants_csv(self, request, queryset):
+        return self.participants_response(list(queryset.values_list('pk', flat=True)), 'csv', 'participants')
+    export_participants_csv.short_description = 'Export participants (CSV)'
+
+    def export_participants_xml(self, request, queryset):
+        return self.participants_response(list(queryset.values_list('pk', flat=True)), 'xml', 'participants')
+    export_participants_xml.short_description = 'Export participants (Excel XML)'
+
+    def import_reservations_view(self, request, object_id):
+        """
+        Register the casymir references of an uploaded CSV file for the event
+        """
+        event = get_object_or_404(Event.objects.select_related('type'), pk=object_id)
+        if not self.has_change_permission(request, event):
+            raise PermissionDenied
+        form = ImportReservationsForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            try:
+                confirmed, waiting, skipped = import_reservations(
+                    event, form.cleaned_data['kind'], read_casy_refs(form.cleaned_data['file']))
+            except ValueError as error:
+                messages.error(request, error)
+            else:
+                messages.success(request, '%d confirmed, %d waiting, %d already registered' % (
+                    confirmed, waiting, skipped))
+                form = ImportReservationsForm()
+        return render(request, 'admin/events/import_reservations.html', {
+            'form': form, 'original': event, 'opts': self.model._meta})
+
     def change_view(self, request, object_id, form_url='', extra_context=None):     # pylint: disable=E0202
         """
         Determine if:
@@ -335,7 +503,7 @@ class EventAdmin(VersionAdmin):
           2. There are people waiting for reservation confirmation
         """
         try:
-            obj = Event.objects.get(id=object_id)
+            obj = Event.objects.with_capacity().get(id=object_id)
         except Event.DoesNotExist:
             pass
         else:
@@ -348,9 +516,95 @@ class EventAdmin(VersionAdmin):
                                                    extra_context=extra_context)
 
 
+class FreeSlotForm(forms.Form):
+    duration = forms.IntegerField(min_value=1, max_value=12 * 60, label='Duration (minutes)')
+    after = forms.DateTimeField(required=False)
+
+
+@admin.register(EventSeries)
+class EventSeriesAdmin(admin.ModelAdmin):
+    list_display = ['template', 'frequency', 'interval', 'until']
+    raw_id_fields = ['template']
+
+    def get_urls(self):
+        return patterns(
+            '',
+            url(r'^(\d+)/occurrences/$',
+                self.admin_site.admin_view(self.occurrences_view),
+                name='events_eventseries_occurrences'),
+        ) + super(EventSeriesAdmin, self).get_urls()
+
+    def occurrences_view(self, request, object_id):
+        """
+        Occurrences of the series in the next weeks ('weeks' parameter). An
+        occurrence is stored as an event when it is edited.
+        """
+        series = get_object_or_404(EventSeries.objects.select_related('template'), pk=object_id)
+        if not self.has_change_permission(request, series):
+            raise PermissionDenied
+        if request.method == 'POST':
+            try:
+                series_start = aware(datetime.strptime(request.POST.get('start', ''), '%Y-%m-%dT%H:%M:%S'))
+                event = get_occurrence(series, series_start)
+            except ValueError as error:
+                messages.error(request, error)
+            else:
+                return redirect('admin:events_event_change', event.pk)
+        try:
+            weeks = min(int(request.GET.get('weeks', 12)), 104)
+        except ValueError:
+            weeks = 12
+        start = aware(datetime.combine(local(timezone.now()).date(), time()))
+        return render(request, 'admin/events/occurrences.html', {
+            'opts': self.model._meta, 'original': series, 'weeks': weeks,
+            'occurrences': occurrences(series, start, start + timedelta(weeks=weeks))})
+
+
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
-    pass
+
+    def get_urls(self):
+        return patterns(
+            '',
+            url(r'^occupancy/$',
+                self.admin_site.admin_view(self.occupancy_view),
+                name='events_location_occupancy'),
+        ) + super(LocationAdmin, self).get_urls()
+
+    def occupancy_view(self, request):
+        """
+        Week grid of the booked slots of a room and search of the earliest
+        free room
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        locations = list(Location.objects.order_by('name'))
+        location = None
+        if request.GET.get('location'):
+            location = get_object_or_404(Location, pk=request.GET['location'])
+        elif locations:
+            location = locations[0]
+        try:
+            week = datetime.strptime(request.GET.get('week', ''), '%Y-%m-%d').date()
+        except ValueError:
+            week = local(timezone.now()).date()
+        monday = week - timedelta(days=week.weekday())
+        grid = []
+        if location is not None:
+            days = week_occupancy(location.pk, monday)
+            first_slot, last_slot = OPENING_HOURS[0] * 2, OPENING_HOURS[1] * 2
+            grid = [('%02d:%02d' % divmod(slot * 30, 60), [bool(slots >> slot & 1) for _day, slots in days])
+                    for slot in range(first_slot, last_slot)]
+        form = FreeSlotForm(request.GET if 'duration' in request.GET else None)
+        free_slot = None
+        if form.is_valid():
+            free_slot = find_free_slot(timedelta(minutes=form.cleaned_data['duration']),
+                                       after=form.cleaned_data['after'], locations=locations)
+        return render(request, 'admin/events/occupancy.html', {
+            'opts': self.model._meta, 'locations': locations, 'location': location,
+            'days': [monday + timedelta(days=offset) for offset in range(7)], 'grid': grid,
+            'previous_week': monday - timedelta(days=7), 'next_week': monday + timedelta(days=7),
+            'form': form, 'free_slot': free_slot})
 
 
 @admin.register(EventType)
@@ -363,18 +617,77 @@ class SpeakerAdmin(admin.ModelAdmin):
     pass
 
 
-@admin.register(InternalReservation)
-class InternalReservationAdmin(admin.ModelAdmin):
+class ReservationEventListFilter(admin.SimpleListFilter):
+    """
+    Filter reservations by one of the recent and upcoming events
+    """
+    title = 'event'
+    parameter_name = 'event'
+
+    def lookups(self, request, model_admin):
+        since = timezone.now() - timedelta(days=30)
+        return Event.objects.filter(start_date__gte=since)\
+            .order_by('start_date').values_list('pk', 'title')
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(event=self.value())
+
+
+class EstimatedCountChangeList(ChangeList):
+    """
+    Changelist estimating the unfiltered total of large tables instead of
+    counting it. get_results relies on ChangeList.get_results of Django 1.7.x
+    counting root_queryset for the full result count.
+    """
+
+    class EstimatedCount(object):
+        def __init__(self, queryset):
+            self.queryset = queryset
+
+        def count(self):
+            return fast_count(self.queryset)
+
+    def get_results(self, request):
+        root_queryset = self.root_queryset
+        self.root_queryset = self.EstimatedCount(root_queryset)
+        try:
+            super(EstimatedCountChangeList, self).get_results(request)
+        finally:
+            self.root_queryset = root_queryset
+
+
+class ReservationAdmin(admin.ModelAdmin):
+    """
+    Reservation tables are large, events are joined and counts are estimated
+    """
     list_display = ['event', 'is_confirmed', 'casy_ref']
     list_display_links = ['event']
+    list_select_related = ['event']
+    list_filter = ['is_confirmed', ReservationEventListFilter]
+    raw_id_fields = ['event']
+    paginator = EstimatedCountPaginator
+
+    def get_changelist(self, request, **kwargs):
+        return EstimatedCountChangeList
+
+
+@admin.register(InternalReservation)
+class InternalReservationAdmin(ReservationAdmin):
+    pass
 
 
 @admin.register(ExternalReservation)
-class ExternalReservationAdmin(admin.ModelAdmin):
-    list_display = ['event', 'is_confirmed', 'casy_ref']
-    list_display_links = ['event']
+class ExternalReservationAdmin(ReservationAdmin):
+    pass
 
 
 @admin.register(Attachment)
 class AttachmentAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['casy_ref', 'message', 'created', 'next_attempt',
+                    'attempts', 'last_error']
@@ -0,0 +1,58 @@
+import time
+from datetime import datetime
+from django.core.cache import cache
+from django.utils import timezone
+
+
+def _version_key(namespace):
+    return 'events:version:%s' % namespace
+
+
+def _modified_key(namespace):
+    return 'events:modified:%s' % namespace
+
+
+def get_version(namespace):
+    """
+    Current version of the namespace. Cached values of a namespace are stored
+    under its version, so bumping the version invalidates all of them.
+    """
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        cache.add(_version_key(namespace), 1, None)
+        version = cache.get(_version_key(namespace), 1)
+    return version
+
+
+def bump_version(namespace):
+    """
+    Invalidate all the cached values of the namespace
+    """
+    try:
+        cache.incr(_version_key(namespace))
+    except ValueError:
+        cache.add(_version_key(namespace), 1, None)
+    cache.set(_modified_key(namespace), time.time(), None)
+
+
+def get_modified(namespace):
+    """
+    When the namespace has been invalidated the last time (or first used)
+    """
+    modified = cache.get(_modified_key(namespace))
+    if modified is None:
+        cache.add(_modified_key(namespace), time.time(), None)
+        modified = cache.get(_modified_key(namespace), time.time())
+    return datetime.fromtimestamp(int(modified), timezone.utc)
+
+
+def get_cached(namespace, name, build, timeout=None):
+    """
+    Value of name in the namespace, built by calling build when not cached
+    """
+    key = 'events:%s:%s:%s' % (namespace, get_version(namespace), name)
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, timeout)
+    return value
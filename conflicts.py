@@ -0,0 +1,49 @@
+import heapq
+from itertools import groupby
+from operator import itemgetter
+from mpi_intranet.events.models import Event
+
+
+def booked_events():
+    """
+    Active in-house events, the only ones occupying a room
+    """
+    return Event.objects.filter(is_active=True, is_inhouse=True, location_name_int__isnull=False)
+
+
+def room_conflicts(location_id, start_date, end_date, exclude_pk=None):
+    """
+    Events booking the room at the same time, an event ending when another
+    one starts doesn't conflict with it. The range is scanned on the
+    (location_name_int, end_date) index, i.e. only the events of the room
+    that haven't ended before start_date.
+    """
+    events = booked_events().filter(location_name_int=location_id, end_date__gt=start_date,
+                                    start_date__lt=end_date)
+    if exclude_pk is not None:
+        events = events.exclude(pk=exclude_pk)
+    return events.order_by('start_date')
+
+
+def find_conflicts(events=None):
+    """
+    All pairs of overlapping events of the same room, as tuples of
+    (room, event, other event) with events as (pk, title, start_date,
+    end_date) tuples. The events are read once ordered by room and start
+    date and swept with a heap of the events in progress, so the cost is
+    O(n log n) plus the number of conflicts.
+    """
+    if events is None:
+        events = booked_events()
+    rows = events.order_by('location_name_int__name', 'start_date')\
+        .values_list('location_name_int__name', 'pk', 'title', 'start_date', 'end_date')\
+        .iterator()
+    for room, room_events in groupby(rows, itemgetter(0)):
+        in_progress = []
+        for row in room_events:
+            event = row[1:]
+            while in_progress and in_progress[0][0] <= event[2]:
+                heapq.heappop(in_progress)
+            for _end_date, other in sorted(in_progress, key=lambda entry: entry[1][2]):
+                yield room, other, event
+            heapq.heappush(in_progress, (event[3], event))
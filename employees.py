@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from django.conf import settings
+from django.core.cache import caches
+from mpi_intranet.base.casymir import get_employee
+
+
+class EmployeeResolver(object):
+    """
+    Resolves many casymir references at once. Records are kept in a bounded
+    in-process LRU cache for ttl seconds and, when cache_alias is set, in
+    that Django cache as well. Casymir has no batch lookup, uncached
+    references are fetched one request each, fetch_workers of them in
+    parallel.
+    """
+
+    def __init__(self, max_size=1024, ttl=300, cache_alias=None, fetch_workers=4):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self.fetch_workers = fetch_workers
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_local(self, casy_refs):
+        found = {}
+        now = time.time()
+        with self._lock:
+            for casy_ref in casy_refs:
+                entry = self._entries.pop(casy_ref, None)
+                if entry is not None and entry[0] > now:
+                    self._entries[casy_ref] = entry
+                    found[casy_ref] = entry[1]
+        return found
+
+    def _set_local(self, employees):
+        expires = time.time() + self.ttl
+        with self._lock:
+            for casy_ref, employee in employees.items():
+                self._entries.pop(casy_ref, None)
+                self._entries[casy_ref] = (expires, employee)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _cache_key(casy_ref):
+        return 'events:employee:%s' % casy_ref
+
+    def _get_shared(self, casy_refs):
+        if not self.cache_alias or not casy_refs:
+            return {}
+        keys = dict((self._cache_key(casy_ref), casy_ref) for casy_ref in casy_refs)
+        return dict((keys[key], employee)
+                    for key, employee in caches[self.cache_alias].get_many(keys.keys()).items())
+
+    def _set_shared(self, employees):
+        if not self.cache_alias or not employees:
+            return
+        caches[self.cache_alias].set_many(
+            dict((self._cache_key(casy_ref), employee)
+                 for casy_ref, employee in employees.items() if employee), self.ttl)
+
+    def _fetch(self, casy_refs):
+        casy_refs = list(casy_refs)
+        workers = max(1, min(self.fetch_workers, len(casy_refs)))
+        if workers == 1:
+            return dict((casy_ref, get_employee(casy_ref)) for casy_ref in casy_refs)
+        pool = ThreadPool(workers)
+        try:
+            return dict(zip(casy_refs, pool.map(get_employee, casy_refs)))
+        finally:
+            pool.close()
+            pool.join()
+
+    def resolve(self, casy_refs):
+        """
+        Returns a dictionary of employee records (None for unknown references)
+        by casymir reference. Only the uncached references are fetched.
+        """
+        casy_refs = set(casy_refs)
+        employees = self._get_local(casy_refs)
+        missing = casy_refs.difference(employees)
+        shared = self._get_shared(missing)
+        missing.difference_update(shared)
+        fetched = self._fetch(missing) if missing else {}
+        for casy_ref in missing:
+            fetched.setdefault(casy_ref, None)
+        self._set_shared(fetched)
+        resolved = dict(shared)
+        resolved.update(fetched)
+        self._set_local(resolved)
+        employees.update(resolved)
+        with self._lock:
+            self.hits += len(casy_refs) - len(missing)
+            self.misses += len(missing)
+        return employees
+
+    def resolve_one(self, casy_ref):
+        """
+        Employee record of a single casymir reference
+        """
+        return self.resolve((casy_ref, ))[casy_ref]
+
+    def stats(self):
+        """
+        Cache statistics
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+def employee_name(employee):
+    """
+    Display name of an employee record, empty for unknown employees
+    """
+    employee = employee or {}
+    return " ".join(employee.get(part) or '' for part in ('salutation_short', 'firstname', 'lastname')).strip()
+
+
+resolver = EmployeeResolver(
+    max_size=getattr(settings, 'EVENTS_EMPLOYEE_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'EVENTS_EMPLOYEE_CACHE_TTL', 300),
+    cache_alias=getattr(settings, 'EVENTS_EMPLOYEE_CACHE', None),
+    fetch_workers=getattr(settings, 'EVENTS_EMPLOYEE_FETCH_WORKERS', 4))
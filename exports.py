@@ -0,0 +1,94 @@
+import csv
+from itertools import islice
+from xml.sax.saxutils import escape
+from mpi_intranet.events.employees import employee_name, resolver
+from mpi_intranet.events.models import Reservation
+
+
+# Number of participants whose names are resolved at once
+RESOLVE_CHUNK_SIZE = 200
+
+HEADER = ('Event', 'Date', 'Kind', 'Casymir ref', 'Name', 'E-mail', 'Status', 'Waiting position', )
+
+
+def participant_rows(event_ids):
+    """
+    Participants of the events, confirmed ones first and then the waiting
+    list in order. Reservations are read with an iterator and the names are
+    resolved chunk by chunk.
+    """
+    reservations = Reservation.objects.filter(event__in=event_ids)\
+        .select_related('event')\
+        .only('kind', 'casy_ref', 'is_confirmed', 'event__title', 'event__start_date')\
+        .order_by('event__start_date', 'event', 'kind', '-is_confirmed', 'id')\
+        .iterator()
+    waiting_positions = {}
+    while True:
+        chunk = list(islice(reservations, RESOLVE_CHUNK_SIZE))
+        if not chunk:
+            return
+        employees = resolver.resolve(reservation.casy_ref for reservation in chunk)
+        for reservation in chunk:
+            employee = employees[reservation.casy_ref] or {}
+            position = ''
+            if not reservation.is_confirmed:
+                key = (reservation.event_id, reservation.kind, )
+                position = waiting_positions[key] = waiting_positions.get(key, 0) + 1
+            yield (
+                reservation.event.title,
+                reservation.event.start_date.strftime('%Y-%m-%d'),
+                reservation.get_kind_display(),
+                reservation.casy_ref,
+                employee_name(employee),
+                employee.get('email') or '',
+                'Confirmed' if reservation.is_confirmed else 'Waiting',
+                position,
+            )
+
+
+class Echo(object):
+    """
+    File-like object returning what is written, to stream csv.writer output
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """
+    UTF-8 CSV lines of the header and the rows
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADER)
+    for row in rows:
+        yield writer.writerow([unicode(value).encode('utf-8') for value in row])
+
+
+def spreadsheet_lines(rows):
+    """
+    Excel 2003 XML spreadsheet (SpreadsheetML) of the header and the rows,
+    served as .xml since it isn't a binary .xls workbook
+    """
+    def row_xml(row):
+        return '<Row>%s</Row>\n' % ''.join(
+            '<Cell><Data ss:Type="%s">%s</Data></Cell>' % (
+                'Number' if isinstance(value, (int, long)) else 'String', escape(unicode(value)))
+            for value in row)
+
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<?mso-application progid="Excel.Sheet"?>\n'
+           '<Workbook xmlns="urn:schemas-microsoft-com:office:spreadsheet" '
+           'xmlns:ss="urn:schemas-microsoft-com:office:spreadsheet">\n'
+           '<Worksheet ss:Name="Participants"><Table>\n')
+    yield row_xml(HEADER)
+    for row in rows:
+        yield row_xml(row).encode('utf-8')
+    yield '</Table></Worksheet></Workbook>\n'
+
+
+# Streaming content generators, content types and file extensions by export format
+FORMATS = {
+    'csv': (csv_lines, 'text/csv; charset=utf-8', 'csv', ),
+    'xml': (spreadsheet_lines, 'application/xml', 'xml', ),
+}
@@ -0,0 +1,82 @@
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+
+def escape(text):
+    """
+    Escape a TEXT value
+    """
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')\
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def fold(line):
+    """
+    Fold a content line into lines of at most 75 octets (UTF-8), multi-octet
+    characters are never split
+    """
+    line = force_text(line)
+    if len(line.encode('utf-8')) <= 75:
+        return line + '\r\n'
+    chunks = []
+    chunk = []
+    size = 0
+    for char in line:
+        octets = len(char.encode('utf-8'))
+        if size + octets > 75:
+            chunks.append(''.join(chunk))
+            # continuation lines start with a space
+            chunk = [' ']
+            size = 1
+        chunk.append(char)
+        size += octets
+    chunks.append(''.join(chunk))
+    return '\r\n'.join(chunks) + '\r\n'
+
+
+def format_datetime(value):
+    """
+    DATE-TIME value, in UTC for aware datetimes
+    """
+    if timezone.is_aware(value):
+        return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def vevent(event, domain):
+    """
+    The lines of the VEVENT component of the event
+    """
+    if event.series_id and event.series_start:
+        # occurrences of a series keep their UID once they are stored
+        uid = 'series-%s-%s' % (event.series_id, format_datetime(event.series_start))
+    else:
+        uid = 'event-%s' % event.pk
+    lines = [
+        'BEGIN:VEVENT',
+        'UID:%s@%s' % (uid, domain),
+        'DTSTAMP:%s' % format_datetime(event.modified),
+        'LAST-MODIFIED:%s' % format_datetime(event.modified),
+        'DTSTART:%s' % format_datetime(event.start_date),
+        'DTEND:%s' % format_datetime(event.end_date),
+        'SUMMARY:%s' % escape(event.title),
+        'LOCATION:%s' % escape(event.location_full),
+        'STATUS:%s' % ('CONFIRMED' if event.is_active else 'CANCELLED'),
+    ]
+    if event.short_description:
+        lines.append('DESCRIPTION:%s' % escape(event.short_description))
+    lines.append('END:VEVENT')
+    return lines
+
+
+def calendar(events, name, domain):
+    """
+    Generate the iCalendar of the events chunk by chunk, one event at a time
+    """
+    yield fold('BEGIN:VCALENDAR')
+    yield fold('VERSION:2.0')
+    yield fold('PRODID:-//MPI Luxembourg//Events//EN')
+    yield fold('X-WR-CALNAME:%s' % escape(name))
+    for event in events:
+        yield ''.join(fold(line) for line in vevent(event, domain))
+    yield fold('END:VCALENDAR')
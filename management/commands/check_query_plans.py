@@ -0,0 +1,69 @@
+import re
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from mpi_intranet.events.models import Event, Reservation
+
+
+def hot_queries():
+    """
+    The querysets of the changelist filters and the capacity checks, with
+    the table each of them must reach through an index
+    """
+    now = timezone.now()
+    return (
+        ('time filter', 'events_event',
+         Event.objects.filter(start_date__gte=now)),
+        ('active and time filters', 'events_event',
+         Event.objects.filter(is_active=True, start_date__gte=now)),
+        ('events with free seats', 'events_event',
+         Event.objects.filter(is_active=True, start_date__gte=now).with_free_seats()),
+        ('location filter', 'events_event',
+         Event.objects.filter(is_inhouse=False, location_name_ext='location')),
+        ('capacity check', 'events_reservation',
+         Reservation.objects.filter(event=1, kind=Reservation.INTERNAL, is_confirmed=True)),
+    )
+
+
+def explain(queryset):
+    """
+    Query plan of the queryset as a list of lines
+    """
+    sql, params = queryset.query.sql_with_params()
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    cursor = connection.cursor()
+    cursor.execute(prefix + sql, params)
+    return [' '.join(unicode(column) for column in row) for row in cursor.fetchall()]
+
+
+def scans_table(plan, table):
+    """
+    Whether the plan reads the whole table
+    """
+    for line in plan:
+        if connection.vendor == 'sqlite':
+            if re.search(r'SCAN (TABLE )?%s\b' % table, line) and 'USING' not in line:
+                return True
+        elif 'Seq Scan on %s' % table in line:
+            return True
+    return False
+
+
+class Command(BaseCommand):
+    help = 'Check that the changelist filters and capacity checks are served by indexes'
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'postgresql':
+            # The planner prefers sequential scans on small tables, only check that an index can be used
+            connection.cursor().execute('SET enable_seqscan = off')
+        failures = []
+        for name, table, queryset in hot_queries():
+            plan = explain(queryset)
+            if scans_table(plan, table):
+                failures.append(name)
+                self.stderr.write('%s scans %s:\n  %s' % (name, table, '\n  '.join(plan)))
+            elif int(options['verbosity']) > 1:
+                self.stdout.write('%s:\n  %s' % (name, '\n  '.join(plan)))
+        if failures:
+            raise CommandError('Queries not using an index: %s' % ', '.join(failures))
+        self.stdout.write('All queries use indexes')
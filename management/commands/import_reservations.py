@@ -0,0 +1,28 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from mpi_intranet.events.models import Event, Reservation
+from mpi_intranet.events.reservations import import_reservations, read_casy_refs
+
+
+class Command(BaseCommand):
+    args = '<event id> <csv file>'
+    help = 'Register the casymir references of the first CSV column for an event'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--external', action='store_const', dest='kind', const=Reservation.EXTERNAL,
+                    default=Reservation.INTERNAL, help='Import external instead of internal reservations'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError('Usage: import_reservations %s' % self.args)
+        try:
+            event = Event.objects.select_related('type').get(pk=args[0])
+        except (Event.DoesNotExist, ValueError):
+            raise CommandError('Event %s does not exist' % args[0])
+        with open(args[1], 'rb') as lines:
+            try:
+                confirmed, waiting, skipped = import_reservations(event, options['kind'], read_casy_refs(lines))
+            except ValueError as error:
+                raise CommandError(error)
+        self.stdout.write('%d confirmed, %d waiting, %d already registered' % (confirmed, waiting, skipped))
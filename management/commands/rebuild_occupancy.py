@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from mpi_intranet.events.models import RoomOccupancy
+from mpi_intranet.events.occupancy import rebuild_occupancy
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the room occupancy grid from the events'
+
+    def handle(self, *args, **options):
+        rebuild_occupancy()
+        self.stdout.write('%d room day(s) booked' % RoomOccupancy.objects.count())
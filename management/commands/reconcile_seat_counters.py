@@ -0,0 +1,39 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from mpi_intranet.events.models import Event, Reservation
+
+
+# Stored Event counters by reservation kind and confirmation
+COUNTERS = (
+    ('internal_confirmed', Reservation.INTERNAL, True),
+    ('internal_waiting', Reservation.INTERNAL, False),
+    ('external_confirmed', Reservation.EXTERNAL, True),
+    ('external_waiting', Reservation.EXTERNAL, False),
+)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored seat counters of events from their reservations'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+                    help='Only report events with wrong counters'),
+    )
+
+    def handle(self, *args, **options):
+        counts = Reservation.objects.counts()
+        events = Event.objects.only(*[counter for counter, _, _ in COUNTERS])
+        reconciled = 0
+        for event in events.iterator():
+            counters = dict((counter, counts.get((event.pk, kind, is_confirmed), 0))
+                            for counter, kind, is_confirmed in COUNTERS)
+            if all(getattr(event, counter) == value for counter, value in counters.items()):
+                continue
+            reconciled += 1
+            self.stdout.write('%s: %s' % (event.pk, ', '.join(
+                '%s %s -> %s' % (counter, getattr(event, counter), counters[counter])
+                for counter, _, _ in COUNTERS)))
+            if not options['dry_run']:
+                Event.objects.filter(pk=event.pk).update(**counters)
+        self.stdout.write('%d event(s) %s' % (
+            reconciled, 'to reconcile' if options['dry_run'] else 'reconciled'))
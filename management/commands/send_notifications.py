@@ -0,0 +1,16 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from mpi_intranet.events.notifications import send_pending
+
+
+class Command(BaseCommand):
+    help = 'Send queued e-mail notifications to registrants'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', dest='batch_size', default=100,
+                    help='Number of notifications claimed at once'),
+    )
+
+    def handle(self, *args, **options):
+        sent, failed = send_pending(options['batch_size'])
+        self.stdout.write('%d notification(s) sent, %d failed' % (sent, failed))
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import Count
+
+
+def fill_seat_counters(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    for prefix, model_name in (('internal', 'InternalReservation'),
+                               ('external', 'ExternalReservation'), ):
+        Reservation = apps.get_model('events', model_name)
+        counts = Reservation.objects.values('event', 'is_confirmed')\
+            .annotate(count=Count('id')).order_by()
+        for count in counts:
+            field = '%s_%s' % (prefix, 'confirmed' if count['is_confirmed'] else 'waiting')
+            Event.objects.filter(pk=count['event']).update(**{field: count['count']})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_auto_20151014_1145'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='external_confirmed',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='external_waiting',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='internal_confirmed',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='internal_waiting',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=True,
+        ),
+        migrations.RunPython(fill_seat_counters, lambda apps, schema_editor: None),
+    ]
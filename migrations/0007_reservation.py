@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# Old reservation models and their kinds
+KINDS = (
+    ('InternalReservation', 'internal'),
+    ('ExternalReservation', 'external'),
+)
+
+BATCH_SIZE = 1000
+
+
+def merge_reservations(apps, schema_editor):
+    Reservation = apps.get_model('events', 'Reservation')
+    for model_name, kind in KINDS:
+        OldReservation = apps.get_model('events', model_name)
+        batch = []
+        for reservation in OldReservation.objects.order_by('id').iterator():
+            batch.append(Reservation(
+                event_id=reservation.event_id, kind=kind, casy_ref=reservation.casy_ref,
+                is_confirmed=reservation.is_confirmed, comment=reservation.comment))
+            if len(batch) == BATCH_SIZE:
+                Reservation.objects.bulk_create(batch)
+                batch = []
+        Reservation.objects.bulk_create(batch)
+
+
+def split_reservations(apps, schema_editor):
+    Reservation = apps.get_model('events', 'Reservation')
+    for model_name, kind in KINDS:
+        OldReservation = apps.get_model('events', model_name)
+        OldReservation.objects.bulk_create([
+            OldReservation(event_id=reservation.event_id, casy_ref=reservation.casy_ref,
+                           is_confirmed=reservation.is_confirmed, comment=reservation.comment)
+            for reservation in Reservation.objects.filter(kind=kind).order_by('id').iterator()],
+            batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0006_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('kind', models.CharField(editable=False, max_length=8, choices=[('internal', 'Internal'), ('external', 'External')])),
+                ('casy_ref', models.IntegerField()),
+                ('is_confirmed', models.BooleanField(default=True)),
+                ('comment', models.TextField()),
+                ('event', models.ForeignKey(related_name='reservations', to='events.Event')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='reservation',
+            index_together=set([('event', 'kind', 'is_confirmed')]),
+        ),
+        migrations.RunPython(merge_reservations, split_reservations),
+        migrations.DeleteModel(
+            name='ExternalReservation',
+        ),
+        migrations.DeleteModel(
+            name='InternalReservation',
+        ),
+        migrations.CreateModel(
+            name='ExternalReservation',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+            },
+            bases=('events.reservation',),
+        ),
+        migrations.CreateModel(
+            name='InternalReservation',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+            },
+            bases=('events.reservation',),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0007_reservation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='start_date',
+            field=models.DateTimeField(db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('is_active', 'start_date'), ('is_inhouse', 'location_name_ext')]),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import F
+
+
+def fill_sort_keys(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    Location = apps.get_model('events', 'Location')
+    Event.objects.filter(is_inhouse=True).update(location_sort='MPI')
+    for location in Location.objects.all():
+        Event.objects.filter(is_inhouse=True, location_name_int=location).update(room_sort=location.name)
+    external = Event.objects.filter(is_inhouse=False)
+    external.filter(location_name_ext__isnull=False).update(location_sort=F('location_name_ext'))
+    external.filter(location_room_ext__isnull=False).update(room_sort=F('location_room_ext'))
+    Event.objects.filter(notes__isnull=False).exclude(notes='').update(has_notes=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0008_event_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='has_notes',
+            field=models.BooleanField(default=False, db_index=True, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='location_sort',
+            field=models.CharField(default='', max_length=64, editable=False, db_index=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='room_sort',
+            field=models.CharField(default='', max_length=64, editable=False, db_index=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(fill_sort_keys, lambda apps, schema_editor: None),
+    ]
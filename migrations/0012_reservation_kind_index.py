@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0011_event_modified'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='reservation',
+            index_together=set([('event', 'kind', 'is_confirmed'), ('kind', 'is_confirmed')]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0012_reservation_kind_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('is_active', 'start_date'), ('is_inhouse', 'location_name_ext'), ('location_name_int', 'end_date')]),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def fill_occupancy(apps, schema_editor):
+    from mpi_intranet.events.occupancy import occupancy_masks
+    Event = apps.get_model('events', 'Event')
+    RoomOccupancy = apps.get_model('events', 'RoomOccupancy')
+    events = Event.objects.filter(is_active=True, is_inhouse=True, location_name_int__isnull=False)\
+        .values_list('location_name_int', 'start_date', 'end_date')
+    RoomOccupancy.objects.bulk_create([
+        RoomOccupancy(location_id=location_id, date=day, slots=slots)
+        for (location_id, day), slots in occupancy_masks(events.iterator()).items()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0013_event_room_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomOccupancy',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('date', models.DateField(db_index=True)),
+                ('slots', models.BigIntegerField(default=0)),
+                ('location', models.ForeignKey(related_name='occupancy', to='events.Location')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='roomoccupancy',
+            unique_together=set([('location', 'date')]),
+        ),
+        migrations.RunPython(fill_occupancy, lambda apps, schema_editor: None),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0014_roomoccupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventSeries',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('frequency', models.CharField(default='weekly', max_length=8, choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly')])),
+                ('interval', models.PositiveSmallIntegerField(default=1)),
+                ('until', models.DateField(null=True, blank=True)),
+                ('template', models.OneToOneField(related_name='template_of', on_delete=django.db.models.deletion.PROTECT, to='events.Event')),
+            ],
+            options={
+                'verbose_name_plural': 'event series',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='series',
+            field=models.ForeignKey(related_name='events', on_delete=django.db.models.deletion.SET_NULL, blank=True, editable=False, to='events.EventSeries', null=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='series_start',
+            field=models.DateTimeField(null=True, editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('is_active', 'start_date'), ('is_inhouse', 'location_name_ext'), ('location_name_int', 'end_date'), ('series', 'series_start')]),
+        ),
+    ]
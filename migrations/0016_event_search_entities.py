@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import re
+from collections import Counter
+from django.db import models, migrations
+from django.utils.html import strip_tags
+from django.utils.text import unescape_entities
+
+
+# Frozen copy of the search document builder (search.build_document and search.tokenize) as of this migration
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return [word.lower()[:64] for word in WORD_RE.findall(text)]
+
+
+def build_document(parts):
+    return '\n'.join(unescape_entities(strip_tags(part)) for part in parts if part)
+
+
+def events_with_speakers(Event, chunk_size=500):
+    """
+    All events in primary key order with their speakers, chunk by chunk
+    """
+    last_pk = 0
+    while True:
+        chunk = list(Event.objects.filter(pk__gt=last_pk).order_by('pk').prefetch_related('speakers')[:chunk_size])
+        if not chunk:
+            return
+        for event in chunk:
+            yield event
+        last_pk = chunk[-1].pk
+
+
+def rebuild_search_documents(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    SearchTerm = apps.get_model('events', 'SearchTerm')
+    full_text = schema_editor.connection.vendor == 'postgresql'
+    for event in events_with_speakers(Event):
+        document = build_document([event.title, event.topic, event.short_description, event.full_description] +
+                                  [speaker.bio for speaker in event.speakers.all()])
+        if document == event.search_document:
+            continue
+        Event.objects.filter(pk=event.pk).update(search_document=document)
+        if not full_text:
+            SearchTerm.objects.filter(event=event.pk).delete()
+            SearchTerm.objects.bulk_create([
+                SearchTerm(event_id=event.pk, term=term, occurrences=occurrences)
+                for term, occurrences in Counter(tokenize(document)).items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0015_eventseries'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_documents, lambda apps, schema_editor: None),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def create_free_seats_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX events_event_free_seats ON events_event (start_date) "
+            "WHERE is_active AND ("
+            "seats_for_internals_only > internal_confirmed + internal_waiting OR "
+            "seats_available > seats_for_internals_only + external_confirmed + external_waiting)")
+
+
+def drop_free_seats_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS events_event_free_seats")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0016_event_search_entities'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_free_seats_index, drop_free_seats_index),
+    ]
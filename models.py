@@ -1,17 +1,115 @@
-from django.db import models
+from collections import OrderedDict
+from django.db import models, transaction
+from django.db.models import Count, F, Q
 from filer.fields.file import FilerFileField
 from djangocms_text_ckeditor.fields import HTMLField
-from django.db.models.signals import pre_delete, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from mpi_intranet.base.email import send
-from mpi_intranet.base.casymir import get_employee
+from django.utils import timezone
+from mpi_intranet.events.caching import bump_version
 
 
-class Event(models.Model):
+# Event reservation counters, maintained with F() updates (see Reservation.update_counter)
+COUNTER_FIELDS = ('internal_confirmed', 'internal_waiting', 'external_confirmed', 'external_waiting', )
+
+# Fields that make up Event.location_full
+LOCATION_FIELDS = ('is_inhouse', 'location_name_int', 'location_name_ext', 'location_building_ext',
+                   'location_room_ext', 'location_contact_ext', )
+
+
+class TrackedFieldsMixin(object):
+    """
+    Remembers the values of tracked_fields as they have been loaded from the
+    database, so that changes can be detected without fetching the object again.
+    TODO: take the snapshot in from_db after the project will be upgraded to
+          Django 1.8.x
+    """
+
+    # Names of the fields to track
+    tracked_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super(TrackedFieldsMixin, self).__init__(*args, **kwargs)
+        self._take_snapshot()
+
+    def _take_snapshot(self):
+        # deferred fields are not in __dict__ and aren't tracked
+        self._loaded_values = {}
+        for name in self.tracked_fields:
+            attname = self._meta.get_field(name).attname
+            if attname in self.__dict__:
+                self._loaded_values[name] = self.__dict__[attname]
+
+    def loaded_values(self):
+        """
+        Values of the tracked fields as stored in the database, None for new objects
+        """
+        if not self._state.adding:
+            return self._loaded_values
+        if self.pk is None:
+            return None
+        # the object has been built rather than loaded, compare with the stored row
+        return type(self)._default_manager.filter(pk=self.pk).values(*self.tracked_fields).first()
+
+    def changed_fields(self, loaded=None):
+        """
+        Names of the tracked fields changed since the object has been loaded
+        (all of them for new objects). loaded can pass on values already
+        returned by loaded_values.
+        """
+        if loaded is None:
+            loaded = self.loaded_values()
+        if loaded is None:
+            return set(self.tracked_fields)
+        return set(name for name, value in loaded.items()
+                   if getattr(self, self._meta.get_field(name).attname) != value)
+
+    def save(self, *args, **kwargs):
+        super(TrackedFieldsMixin, self).save(*args, **kwargs)
+        self._take_snapshot()
+
+
+class EventQuerySet(models.QuerySet):
+    """
+    Event queryset with reservation capacity helpers, reading the stored counters
+    """
+
+    def with_capacity(self):
+        """
+        Annotate the internal and external seats that are neither confirmed
+        nor waiting ('internal_free' and 'external_free'), computed from the
+        stored counters in the same query
+        """
+        return self.extra(select=OrderedDict((
+            ('internal_free', 'events_event.seats_for_internals_only'
+                              ' - events_event.internal_confirmed - events_event.internal_waiting'),
+            ('external_free', 'events_event.seats_available - events_event.seats_for_internals_only'
+                              ' - events_event.external_confirmed - events_event.external_waiting'),
+        )))
+
+    def with_free_seats(self):
+        """
+        Events with internal or external seats that are neither confirmed nor
+        waiting (see Event.is_available). Combined with the active and start
+        date filters the query is served by the (is_active, start_date) index,
+        on PostgreSQL by the partial events_event_free_seats index.
+        """
+        return self.filter(
+            Q(seats_for_internals_only__gt=F('internal_confirmed') + F('internal_waiting')) |
+            Q(seats_available__gt=F('seats_for_internals_only') + F('external_confirmed') +
+              F('external_waiting')))
+
+
+class Event(TrackedFieldsMixin, models.Model):
     """
     Events that are hosted by the MPI Luxembourg
     """
 
+    objects = EventQuerySet.as_manager()
+
+    tracked_fields = ('type', 'start_date', 'end_date', 'is_active', 'seats_available',
+                      'seats_for_internals_only', ) + LOCATION_FIELDS
+
     # the title of the event that will be displayed publically
     title = models.CharField(max_length=64)
 
@@ -29,7 +127,7 @@ class Event(models.Model):
     topic = models.CharField(max_length=128, blank=True, null=True)
 
     # The Start date of the event (inclusive)
-    start_date = models.DateTimeField()
+    start_date = models.DateTimeField(db_index=True)
 
     # The End date of the event (inclusive)
     end_date = models.DateTimeField()
@@ -74,6 +172,39 @@ class Event(models.Model):
     # external reservations are allowed)
     seats_for_internals_only = models.IntegerField(null=True)
 
+    # Reservation counters, maintained by the reservations themselves (see Reservation.save and
+    # reservation_counter_delete). Use 'reconcile_seat_counters' command to rebuild them from the reservations.
+    internal_confirmed = models.PositiveIntegerField(default=0, editable=False)
+    internal_waiting = models.PositiveIntegerField(default=0, editable=False)
+    external_confirmed = models.PositiveIntegerField(default=0, editable=False)
+    external_waiting = models.PositiveIntegerField(default=0, editable=False)
+
+    # Sort keys of the Location, Room and Remark columns of the admin changelist, computed on save
+    location_sort = models.CharField(max_length=64, blank=True, default='', editable=False, db_index=True)
+    room_sort = models.CharField(max_length=64, blank=True, default='', editable=False, db_index=True)
+    has_notes = models.BooleanField(default=False, editable=False, db_index=True)
+
+    # Plain text of the title, topic, descriptions and speaker biographies, maintained by search.index_event
+    search_document = models.TextField(blank=True, default='', editable=False)
+
+    # When the event has been changed the last time
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    # The series this event is an occurrence of (see series.materialize)
+    series = models.ForeignKey('EventSeries', blank=True, null=True, editable=False, related_name='events',
+                               on_delete=models.SET_NULL)
+
+    # The start date of the occurrence in the series, kept when the event is moved
+    series_start = models.DateTimeField(blank=True, null=True, editable=False)
+
+    class Meta(object):
+        index_together = [
+            ('is_active', 'start_date'),
+            ('is_inhouse', 'location_name_ext'),
+            ('location_name_int', 'end_date'),
+            ('series', 'series_start'),
+        ]
+
     @property
     def location_full(self):
         """
@@ -91,17 +222,30 @@ class Event(models.Model):
         return "%s, %s" % (location_and_room, building_and_contact) if building_and_contact.strip() else \
             "%s" % location_and_room
 
+    @property
+    def internal_reservations(self):
+        """
+        Reservations of MPI employees
+        """
+        return EventReservationManager(InternalReservation, self)
+
+    @property
+    def external_reservations(self):
+        """
+        Reservations of externals
+        """
+        return EventReservationManager(ExternalReservation, self)
+
     def __unicode__(self):  # pragma: no cover
         return self.title
 
     def save(self, *args, **kwargs):
-        if self.id:
+        if self.id and 'type' in self.changed_fields():
+            from mpi_intranet.events.reservations import cancel_reservations
             if not self.type.allow_internal_registrations:
-                if self.internal_reservations.all():
-                    self.internal_reservations.all().delete()
+                cancel_reservations(self, InternalReservation)
             if not self.type.allow_external_registrations:
-                if self.external_reservations.all():
-                    self.external_reservations.all().delete()
+                cancel_reservations(self, ExternalReservation)
             if not self.type.has_speakers:
                 self.speakers.clear()
         if self.is_inhouse:
@@ -113,17 +257,43 @@ class Event(models.Model):
             self.location_name_int = None
         if not self.type.has_topic:
             self.topic = None
+        self.update_sort_keys()
+        if self.pk and not self._state.adding and not kwargs.get('force_insert') and \
+           kwargs.get('update_fields') is None:
+            # the counters may have changed since the event has been loaded, don't overwrite them
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in COUNTER_FIELDS]
         super(Event, self).save(*args, **kwargs)
 
+    def recount(self):
+        """
+        Rebuild the stored counters from the reservations
+        """
+        counts = Reservation.objects.filter(event=self.pk).counts()
+        Event.objects.filter(pk=self.pk).update(**dict(
+            ('%s_%s' % (kind, 'confirmed' if is_confirmed else 'waiting'),
+             counts.get((self.pk, kind, is_confirmed), 0))
+            for kind in (Reservation.INTERNAL, Reservation.EXTERNAL) for is_confirmed in (True, False)))
+
+    def update_sort_keys(self):
+        """
+        Compute the stored sort keys from the location and the notes
+        """
+        if self.is_inhouse:
+            self.location_sort = 'MPI'
+            self.room_sort = self.location_name_int.name if self.location_name_int else ''
+        else:
+            self.location_sort = self.location_name_ext or ''
+            self.room_sort = self.location_room_ext or ''
+        self.has_notes = bool(self.notes)
+
     def is_overbooked(self):
         """
         Check if event is overbooked
         """
         int_seats = self.seats_for_internals_only
         ext_seats = self.seats_available - self.seats_for_internals_only
-        int_confirmed = self.internal_reservations.filter(is_confirmed=True).count()
-        ext_confirmed = self.external_reservations.filter(is_confirmed=True).count()
-        if int_seats < int_confirmed or ext_seats < ext_confirmed:
+        if int_seats < self.internal_confirmed or ext_seats < self.external_confirmed:
             return True
         else:
             return False
@@ -134,12 +304,8 @@ class Event(models.Model):
         """
         int_seats = self.seats_for_internals_only
         ext_seats = self.seats_available - self.seats_for_internals_only
-        int_confirmed = self.internal_reservations.filter(is_confirmed=True).count()
-        ext_confirmed = self.external_reservations.filter(is_confirmed=True).count()
-        int_unconfirmed = self.internal_reservations.filter(is_confirmed=False).count()
-        ext_unconfirmed = self.external_reservations.filter(is_confirmed=False).count()
-        if int_unconfirmed > 0 and int_confirmed < int_seats or \
-           ext_unconfirmed > 0 and ext_confirmed < ext_seats:
+        if self.internal_waiting > 0 and self.internal_confirmed < int_seats or \
+           self.external_waiting > 0 and self.external_confirmed < ext_seats:
             return True
         else:
             return False
@@ -148,10 +314,13 @@ class Event(models.Model):
         """
         Check if event has free seats
         """
+        if hasattr(self, 'internal_free'):
+            # annotated by EventQuerySet.with_capacity
+            return self.internal_free > 0 or self.external_free > 0
         int_seats = self.seats_for_internals_only
         ext_seats = self.seats_available - self.seats_for_internals_only
-        int_all = self.internal_reservations.count()
-        ext_all = self.external_reservations.count()
+        int_all = self.internal_confirmed + self.internal_waiting
+        ext_all = self.external_confirmed + self.external_waiting
         if int_seats > int_all or ext_seats > ext_all:
             return True
         else:
@@ -170,6 +339,70 @@ class Location(models.Model):
         return self.name
 
 
+class EventSeries(models.Model):
+    """
+    Recurring events. The occurrences are copies of the template event at
+    other dates, generated on demand and only stored as events when they get
+    reservations or edits (see series.py).
+    """
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+    MONTHLY = 'monthly'
+    FREQUENCY_CHOICES = (
+        (DAILY, 'Daily'),
+        (WEEKLY, 'Weekly'),
+        (MONTHLY, 'Monthly'),
+    )
+
+    # The first occurrence, copied for the other ones. Its series_start anchors the occurrences.
+    template = models.OneToOneField('Event', related_name='template_of', on_delete=models.PROTECT)
+
+    # How often the event recurs
+    frequency = models.CharField(max_length=8, choices=FREQUENCY_CHOICES, default=WEEKLY)
+
+    # Number of days, weeks or months between two occurrences
+    interval = models.PositiveSmallIntegerField(default=1)
+
+    # The last day of the series (inclusive), the series doesn't end when empty
+    until = models.DateField(blank=True, null=True)
+
+    class Meta(object):
+        verbose_name_plural = 'event series'
+
+    def __unicode__(self):  # pragma: no cover
+        return '%s (%s)' % (self.template, self.get_frequency_display())
+
+    def save(self, *args, **kwargs):
+        super(EventSeries, self).save(*args, **kwargs)
+        # a new template starts the series where it is, moving it later doesn't move the series
+        Event.objects.filter(pk=self.template_id).exclude(series=self)\
+            .update(series=self, series_start=F('start_date'))
+
+
+class RoomOccupancy(models.Model):
+    """
+    Booked half-hour slots of a room on a day, maintained by
+    occupancy.update_occupancy. Days without bookings have no row.
+    """
+
+    # The room
+    location = models.ForeignKey('Location', related_name='occupancy')
+
+    # The day (local time)
+    date = models.DateField(db_index=True)
+
+    # Bit n is set when the slot starting n * 30 minutes after midnight is booked
+    slots = models.BigIntegerField(default=0)
+
+    class Meta(object):
+        unique_together = [
+            ('location', 'date'),
+        ]
+
+    def __unicode__(self):  # pragma: no cover
+        return '%s %s' % (self.location, self.date)
+
+
 class EventType(models.Model):
     """
     The event type. Event types set the appearance of the event on the intranet pages and set whether or not
@@ -218,11 +451,83 @@ class Speaker(models.Model):
         return unicode(self.casy_ref)
 
 
-class Reservation(models.Model):
+class ReservationQuerySet(models.QuerySet):
     """
-    The abstract reservation class
+    Reservation queryset
     """
 
+    def counts(self):
+        """
+        Number of reservations by (event id, kind, is_confirmed), in one GROUP BY query
+        """
+        return dict(((count['event'], count['kind'], count['is_confirmed']), count['count'])
+                    for count in self.values('event', 'kind', 'is_confirmed').annotate(count=Count('id')).order_by())
+
+
+class ReservationManager(models.Manager.from_queryset(ReservationQuerySet)):
+    """
+    Reservations manager. The managers of InternalReservation and
+    ExternalReservation are limited to their kind.
+    """
+
+    def get_queryset(self):
+        qs = super(ReservationManager, self).get_queryset()
+        if self.model.default_kind:
+            qs = qs.filter(kind=self.model.default_kind)
+        return qs
+
+
+class EventReservationManager(ReservationManager):
+    """
+    Reservations of one kind of an event (Event.internal_reservations and
+    Event.external_reservations). Like a reverse foreign key manager the
+    reservations it creates are for the event, use the 'reservations'
+    relation with a kind for lookups and prefetching.
+    """
+
+    def __init__(self, model, event):
+        super(EventReservationManager, self).__init__()
+        self.model = model
+        self.event = event
+
+    def get_queryset(self):
+        return super(EventReservationManager, self).get_queryset().filter(event=self.event)
+
+    def create(self, **kwargs):
+        kwargs['event'] = self.event
+        return super(EventReservationManager, self).create(**kwargs)
+
+    def get_or_create(self, defaults=None, **kwargs):
+        kwargs['event'] = self.event
+        return super(EventReservationManager, self).get_or_create(defaults=defaults, **kwargs)
+
+    def update_or_create(self, defaults=None, **kwargs):
+        kwargs['event'] = self.event
+        return super(EventReservationManager, self).update_or_create(defaults=defaults, **kwargs)
+
+
+class Reservation(TrackedFieldsMixin, models.Model):
+    """
+    A reservation for an event. Internal and external reservations are stored
+    together and told apart by kind, use the InternalReservation and
+    ExternalReservation proxies to work with one kind only.
+    """
+
+    INTERNAL = 'internal'
+    EXTERNAL = 'external'
+    KIND_CHOICES = (
+        (INTERNAL, 'Internal'),
+        (EXTERNAL, 'External'),
+    )
+
+    objects = ReservationManager()
+
+    # The event this reservation is for
+    event = models.ForeignKey('Event', related_name='reservations')
+
+    # Whether this is a reservation by an employee of the MPI or by an external
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES, editable=False)
+
     # a casymir reference number
     casy_ref = models.IntegerField()
 
@@ -232,8 +537,49 @@ class Reservation(models.Model):
     # A place for the event manager to leave an internal comment for this reservation
     comment = models.TextField()
 
+    # The kind of the reservations of a proxy model
+    default_kind = None
+
+    tracked_fields = ('event', 'is_confirmed', )
+
     class Meta(object):
-        abstract = True
+        index_together = [
+            ('event', 'kind', 'is_confirmed'),
+            ('kind', 'is_confirmed'),
+        ]
+
+    def __unicode__(self):  # pragma: no cover
+        # TODO resolve the full name of the participant
+        return str(self.casy_ref)
+
+    def update_counter(self, is_confirmed, delta, event_id=None):
+        """
+        Atomically add delta to the counter of the given status of the event
+        (the event of the reservation by default)
+        """
+        field = '%s_%s' % (self.kind, 'confirmed' if is_confirmed else 'waiting')
+        Event.objects.filter(pk=event_id or self.event_id).update(**{field: F(field) + delta})
+
+    def save(self, *args, **kwargs):
+        if not self.kind:
+            self.kind = self.default_kind
+        with transaction.atomic():
+            loaded = self.loaded_values()
+            super(Reservation, self).save(*args, **kwargs)
+            if loaded is None:
+                self.update_counter(self.is_confirmed, 1)
+                return
+            changed = self.changed_fields(loaded)
+            if 'event' in changed:
+                # moved to another event, the seat of the old event is released
+                from mpi_intranet.events.reservations import promote_waiting
+                self.update_counter(loaded['is_confirmed'], -1, event_id=loaded['event'])
+                self.update_counter(self.is_confirmed, 1)
+                if loaded['is_confirmed']:
+                    promote_waiting(loaded['event'], self.kind)
+            elif 'is_confirmed' in changed:
+                self.update_counter(not self.is_confirmed, -1)
+                self.update_counter(self.is_confirmed, 1)
 
 
 class InternalReservation(Reservation):
@@ -241,7 +587,10 @@ class InternalReservation(Reservation):
     A reservation by a employee of the MPI. casy_ref points to a 'PersonalNummer' in casymir.
     """
 
-    event = models.ForeignKey('Event', related_name='internal_reservations')
+    default_kind = Reservation.INTERNAL
+
+    class Meta(object):
+        proxy = True
 
     def __unicode__(self):  # pragma: no cover
         # TODO resolve the full name of the internal participant
@@ -253,7 +602,10 @@ class ExternalReservation(Reservation):
     A reservation by an external of the MPI. casy_ref points to a '... (TBD)' in casymir.
     """
 
-    event = models.ForeignKey('Event', related_name='external_reservations')
+    default_kind = Reservation.EXTERNAL
+
+    class Meta(object):
+        proxy = True
 
     def __unicode__(self):  # pragma: no cover
         # TODO resolve the full name of the external participant
@@ -277,122 +629,282 @@ class Attachment(models.Model):
         return self.title
 
 
-@receiver(pre_save, sender=Event, dispatch_uid="event_save_signal")
-def event_save(sender, instance, using, **kwargs):  # pylint: disable=W0613,R0912
+class SearchTerm(models.Model):
     """
-    Send e-mails to all people registered to an event with updated dates or
-    cancel notification
+    Inverted index of the event search documents, used when the database has no full-text search
     """
-    def dates_updated(registration):
-        """
-        Dates have been updated
-        """
-        employee = get_employee(registration.casy_ref)
-        if employee and employee["email"]:
-            salut = " ".join([employee["salutation_short"], employee["firstname"], employee["lastname"]])
-            send("test",
-                 (employee["email"], ),
-                 {"msg": "%s\nDates of the event have been changed to: %s - %s" % (
-                     salut, instance.start_date, instance.end_date, )})
-
-    def event_canceled(registration):
-        """
-        Event has been canceled
-        """
-        employee = get_employee(registration.casy_ref)
-        if employee and employee["email"]:
-            salut = " ".join([employee["salutation_short"], employee["firstname"], employee["lastname"]])
-            send("test", (employee["email"], ),
-                 {"msg": "%s\nThis event has been canceled" % salut})
 
-    def event_activated(registration):
-        """
-        Event has been activated
-        """
-        employee = get_employee(registration.casy_ref)
-        if employee and employee["email"]:
-            salut = " ".join([employee["salutation_short"], employee["firstname"], employee["lastname"]])
-            send("test", (employee["email"], ),
-                 {"msg": "%s\nThis event will be performed" % salut})
+    # A lowercased word of the search document
+    term = models.CharField(max_length=64, db_index=True)
+
+    # The event whose search document contains the word
+    event = models.ForeignKey('Event', related_name='search_terms')
+
+    # How often the word occurs in the search document
+    occurrences = models.PositiveIntegerField()
+
+    def __unicode__(self):  # pragma: no cover
+        return self.term
+
 
-    def location_updated(registration):
+class Notification(models.Model):
+    """
+    An e-mail notification waiting to be sent to a registrant. Notifications are written together with
+    the change they are about and sent by the 'send_notifications' command.
+    """
+
+    # casymir reference of the recipient
+    casy_ref = models.IntegerField()
+
+    # The message, the salutation of the recipient is put in front of it when it is sent
+    message = models.TextField()
+
+    # When the notification has been queued
+    created = models.DateTimeField(auto_now_add=True)
+
+    # The notification won't be sent before this time (used for retries and to claim notifications)
+    next_attempt = models.DateTimeField(default=timezone.now, db_index=True)
+
+    # Number of failed attempts to send the notification
+    attempts = models.PositiveIntegerField(default=0)
+
+    # The error of the last failed attempt
+    last_error = models.TextField(blank=True, null=True)
+
+    def __unicode__(self):  # pragma: no cover
+        return "%s: %s" % (self.casy_ref, self.message)
+
+    @classmethod
+    def enqueue(cls, casy_refs, message):
         """
-        Location has been updated
+        Queue the message for all the given registrants in a single query
         """
-        employee = get_employee(registration.casy_ref)
-        if employee and employee["email"]:
-            salut = " ".join([employee["salutation_short"], employee["firstname"], employee["lastname"]])
-            send("test", (employee["email"], ),
-                 {"msg": "%s\nLocation of the event has been changed to: %s" % (salut, instance.location_full, )})
+        cls.objects.bulk_create([cls(casy_ref=casy_ref, message=message) for casy_ref in casy_refs])
+
 
+@receiver(pre_save, sender=Event, dispatch_uid="event_save_signal")
+def event_save(sender, instance, using, **kwargs):  # pylint: disable=W0613
+    """
+    Queue e-mails to all people registered to an event with updated dates or
+    cancel notification
+    """
     if instance.pk:
-        obj = Event.objects.get(pk=instance.pk)
-        if instance.start_date != obj.start_date or instance.end_date != obj.end_date:
-            for registration in InternalReservation.objects.filter(event=instance):
-                dates_updated(registration)
-            for registration in ExternalReservation.objects.filter(event=instance):
-                dates_updated(registration)
-        elif instance.is_active != obj.is_active:
+        changed = instance.changed_fields()
+        if changed.intersection(('start_date', 'end_date', )):
+            message = "Dates of the event have been changed to: %s - %s" % (
+                instance.start_date, instance.end_date, )
+        elif 'is_active' in changed:
             if instance.is_active:
-                for registration in InternalReservation.objects.filter(event=instance):
-                    event_activated(registration)
-                for registration in ExternalReservation.objects.filter(event=instance):
-                    event_activated(registration)
+                message = "This event will be performed"
             else:
-                for registration in InternalReservation.objects.filter(event=instance):
-                    event_canceled(registration)
-                for registration in ExternalReservation.objects.filter(event=instance):
-                    event_canceled(registration)
-        elif instance.location_full != obj.location_full:
-            for registration in InternalReservation.objects.filter(event=instance):
-                location_updated(registration)
-            for registration in ExternalReservation.objects.filter(event=instance):
-                location_updated(registration)
+                message = "This event has been canceled"
+        elif changed.intersection(LOCATION_FIELDS):
+            message = "Location of the event has been changed to: %s" % (instance.location_full, )
+        else:
+            return
+        casy_refs = list(instance.reservations.values_list('casy_ref', flat=True))
+        Notification.enqueue(casy_refs, message)
 
 
+@receiver(pre_save, sender=Reservation,
+          dispatch_uid="registration_save_signal")
 @receiver(pre_save, sender=InternalReservation,
           dispatch_uid="internal_registration_save_signal")
 @receiver(pre_save, sender=ExternalReservation,
           dispatch_uid="external_registration_save_signal")
 def registration_save(sender, instance, using, **kwargs):   # pylint: disable=W0613
     """
-    Send new registration or registration status update email to registered
+    Queue new registration or registration status update email to registered
     person
     """
     if not instance.pk:
-        employee = get_employee(instance.casy_ref)
-        if employee and employee["email"]:
-            salut = " ".join([employee["salutation_short"], employee["firstname"], employee["lastname"]])
-            send("test",
-                 (employee["email"], ),
-                 {"msg": "%s\nYou have new registration with status %s" % (
-                     salut, "Confirmed" if instance.is_confirmed else "Waiting", )})
-    else:
-        try:
-            obj = InternalReservation.objects.get(pk=instance.pk)
-        except InternalReservation.DoesNotExist:
-            obj = ExternalReservation.objects.get(pk=instance.pk)
-        if instance.is_confirmed != obj.is_confirmed:
-            employee = get_employee(instance.casy_ref)
-            if employee and employee["email"]:
-                salut = " ".join([employee["salutation_short"], employee["firstname"], employee["lastname"]])
-                send("test",
-                     (employee["email"], ),
-                     {"msg": "%s\nStatus of your registration has been changed to %s" % (
-                         salut, "Confirmed" if instance.is_confirmed else "Waiting", )})
+        Notification.enqueue((instance.casy_ref, ), "You have new registration with status %s" % (
+            "Confirmed" if instance.is_confirmed else "Waiting", ))
+    elif 'is_confirmed' in instance.changed_fields():
+        Notification.enqueue((instance.casy_ref, ), "Status of your registration has been changed to %s" % (
+            "Confirmed" if instance.is_confirmed else "Waiting", ))
 
 
+@receiver(pre_delete, sender=Reservation,
+          dispatch_uid="registration_delete_signal")
 @receiver(pre_delete, sender=InternalReservation,
           dispatch_uid="internal_registration_delete_signal")
 @receiver(pre_delete, sender=ExternalReservation,
           dispatch_uid="external_registration_delete_signal")
 def registration_delete(sender, instance, using, **kwargs):     # pylint: disable=W0613
     """
-    Send e-mail notification about registration deletion to previously
+    Queue e-mail notification about registration deletion to previously
     registered person
     """
-    employee = get_employee(instance.casy_ref)
-    if employee and employee["email"]:
-        salut = " ".join([employee["salutation_short"], employee["firstname"], employee["lastname"]])
-        send("test", (employee["email"], ),
-             {"msg": "%s\nYour registration has been deleted" % salut})
+    Notification.enqueue((instance.casy_ref, ), "Your registration has been deleted")
+
+
+@receiver(post_delete, sender=Reservation,
+          dispatch_uid="reservation_counter_delete_signal")
+@receiver(post_delete, sender=InternalReservation,
+          dispatch_uid="internal_reservation_counter_delete_signal")
+@receiver(post_delete, sender=ExternalReservation,
+          dispatch_uid="external_reservation_counter_delete_signal")
+def reservation_counter_delete(sender, instance, using, **kwargs):     # pylint: disable=W0613
+    """
+    Release the seat of a deleted reservation in the event counters and give
+    it to the oldest waiting registrant
+    """
+    from mpi_intranet.events.reservations import promote_waiting
+    instance.update_counter(instance.is_confirmed, -1)
+    if instance.is_confirmed:
+        promote_waiting(instance.event_id, instance.kind)
+
+
+@receiver(post_save, sender=Event, dispatch_uid="event_seats_save_signal")
+def event_seats_save(sender, instance, created, using, **kwargs):     # pylint: disable=W0613
+    """
+    Give seats added to an event to waiting registrants
+    """
+    from mpi_intranet.events.reservations import promote_waiting
+    if not created and instance.changed_fields().intersection(('seats_available', 'seats_for_internals_only', )):
+        promote_waiting(instance.pk, Reservation.INTERNAL)
+        promote_waiting(instance.pk, Reservation.EXTERNAL)
+
+
+@receiver(post_save, sender=Event, dispatch_uid="event_counters_raw_save_signal")
+def event_counters_raw_save(sender, instance, raw, using, **kwargs):     # pylint: disable=W0613
+    """
+    Recount the reservations of an event saved as is (fixtures, reverted
+    versions), its stored counters may be outdated
+    """
+    if raw:
+        instance.recount()
+
+
+@receiver(post_save, sender=Reservation, dispatch_uid="reservation_counters_raw_save_signal")
+@receiver(post_save, sender=InternalReservation, dispatch_uid="internal_reservation_counters_raw_save_signal")
+@receiver(post_save, sender=ExternalReservation, dispatch_uid="external_reservation_counters_raw_save_signal")
+def reservation_counters_raw_save(sender, instance, raw, using, **kwargs):     # pylint: disable=W0613
+    """
+    Recount the reservations of the event of a reservation saved as is,
+    Reservation.save hasn't updated the counters
+    """
+    if raw:
+        Event(pk=instance.event_id).recount()
+
+
+@receiver(post_save, sender=Event, dispatch_uid="event_cache_save_signal")
+@receiver(post_delete, sender=Event, dispatch_uid="event_cache_delete_signal")
+def event_cache_invalidate(sender, instance, using, **kwargs):     # pylint: disable=W0613
+    """
+    Invalidate the values cached in the 'events' namespace (e.g. filter choices)
+    """
+    bump_version('events')
+
+
+@receiver(post_save, sender=EventSeries, dispatch_uid="event_series_cache_save_signal")
+@receiver(post_delete, sender=EventSeries, dispatch_uid="event_series_cache_delete_signal")
+def event_series_cache_invalidate(sender, instance, using, **kwargs):     # pylint: disable=W0613
+    """
+    Invalidate the cached event listings, they include the occurrences of the series
+    """
+    bump_version('events')
+
+
+@receiver(post_save, sender=Location, dispatch_uid="location_save_signal")
+def location_save(sender, instance, created, using, **kwargs):  # pylint: disable=W0613
+    """
+    Update the room sort key (and the modification time) of the events at a renamed location
+    """
+    if not created:
+        Event.objects.filter(is_inhouse=True, location_name_int=instance).update(
+            room_sort=instance.name, modified=timezone.now())
+
+
+@receiver(post_save, sender=Event, dispatch_uid="event_search_save_signal")
+def event_search_save(sender, instance, using, **kwargs):  # pylint: disable=W0613
+    """
+    Rebuild the search document of a saved event
+    """
+    from mpi_intranet.events.search import index_event
+    index_event(instance)
+
+
+@receiver(m2m_changed, sender=Event.speakers.through, dispatch_uid="event_speakers_search_signal")
+def event_speakers_search(sender, instance, action, reverse, pk_set, **kwargs):  # pylint: disable=W0613
+    """
+    Rebuild the search documents of events whose speakers changed
+    """
+    from mpi_intranet.events.search import index_event
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            index_event(instance)
+    elif action == 'pre_clear':
+        # the events of the speaker are gone after the clear, remember them
+        instance._cleared_event_ids = list(instance.event_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        event_ids = pk_set if action != 'post_clear' else instance.__dict__.pop('_cleared_event_ids', ())
+        for event in Event.objects.filter(pk__in=event_ids):
+            index_event(event)
+
+
+@receiver(post_save, sender=Speaker, dispatch_uid="speaker_search_save_signal")
+def speaker_search_save(sender, instance, created, using, **kwargs):  # pylint: disable=W0613
+    """
+    Rebuild the search documents of the events of a speaker whose biography changed
+    """
+    from mpi_intranet.events.search import index_event
+    if not created:
+        for event in instance.event_set.all():
+            index_event(event)
+
+
+@receiver(post_save, sender=EventType, dispatch_uid="event_type_cache_save_signal")
+@receiver(post_delete, sender=EventType, dispatch_uid="event_type_cache_delete_signal")
+def event_type_cache_invalidate(sender, instance, using, **kwargs):     # pylint: disable=W0613
+    """
+    Invalidate the cached event type options
+    """
+    bump_version('event_types')
+
+
+@receiver(post_save, sender=Reservation, dispatch_uid="reservation_cache_save_signal")
+@receiver(post_save, sender=InternalReservation, dispatch_uid="internal_reservation_cache_save_signal")
+@receiver(post_save, sender=ExternalReservation, dispatch_uid="external_reservation_cache_save_signal")
+@receiver(post_delete, sender=Reservation, dispatch_uid="reservation_cache_delete_signal")
+@receiver(post_delete, sender=InternalReservation, dispatch_uid="internal_reservation_cache_delete_signal")
+@receiver(post_delete, sender=ExternalReservation, dispatch_uid="external_reservation_cache_delete_signal")
+def reservation_cache_invalidate(sender, instance, using, **kwargs):     # pylint: disable=W0613
+    """
+    Invalidate the values cached in the 'reservations' namespace (e.g. free seats of upcoming events)
+    """
+    bump_version('reservations')
+
+
+@receiver(pre_save, sender=Event, dispatch_uid="event_occupancy_pre_save_signal")
+def event_occupancy_pre_save(sender, instance, using, **kwargs):  # pylint: disable=W0613
+    """
+    Remember the stored dates and room of the event for event_occupancy_save.
+    Raw saves (fixtures, reverted versions) build the instance from the new
+    values, so its snapshot doesn't tell the stored ones.
+    """
+    instance._stored_booking = instance.loaded_values()
+
+
+@receiver(post_save, sender=Event, dispatch_uid="event_occupancy_save_signal")
+def event_occupancy_save(sender, instance, created, using, **kwargs):  # pylint: disable=W0613
+    """
+    Update the occupancy of the rooms and days booked by the event before and after the save
+    """
+    from mpi_intranet.events.occupancy import update_occupancy
+    loaded = instance.__dict__.pop('_stored_booking', None) or {}
+    if created or instance.changed_fields(loaded).intersection(
+            ('start_date', 'end_date', 'is_active', 'is_inhouse', 'location_name_int', )):
+        if loaded.get('location_name_int') and loaded.get('start_date') and loaded.get('end_date'):
+            update_occupancy(loaded['location_name_int'], loaded['start_date'], loaded['end_date'])
+        update_occupancy(instance.location_name_int_id, instance.start_date, instance.end_date)
+
+
+@receiver(post_delete, sender=Event, dispatch_uid="event_occupancy_delete_signal")
+def event_occupancy_delete(sender, instance, using, **kwargs):  # pylint: disable=W0613
+    """
+    Release the room slots of a deleted event
+    """
+    from mpi_intranet.events.occupancy import update_occupancy
+    update_occupancy(instance.location_name_int_id, instance.start_date, instance.end_date)
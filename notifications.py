@@ -0,0 +1,149 @@
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from mpi_intranet.events.employees import resolver
+from mpi_intranet.events.models import Notification
+
+
+# Notifications failing this many times are not retried anymore
+MAX_ATTEMPTS = 8
+
+# Delay before the first retry, doubled with every further failed attempt
+RETRY_DELAY = timedelta(minutes=1)
+
+# How long a batch is reserved for the worker that claimed it
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+# Number of mail connections used in parallel to send a batch
+MAIL_CONNECTIONS = getattr(settings, 'EVENTS_MAIL_CONNECTIONS', 4)
+
+# Subject of notification e-mails
+SUBJECT = getattr(settings, 'EVENTS_NOTIFICATION_SUBJECT', 'MPI Events')
+
+
+def claim_batch(batch_size):
+    """
+    Reserve a batch of due notifications, so that concurrent workers don't
+    send them twice
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(Notification.objects.select_for_update()
+                     .filter(next_attempt__lte=now, attempts__lt=MAX_ATTEMPTS)
+                     .order_by('next_attempt', 'id')[:batch_size])
+        Notification.objects.filter(pk__in=[notification.pk for notification in batch])\
+            .update(next_attempt=now + CLAIM_TIMEOUT)
+    return batch
+
+
+def render(notification, employee):
+    """
+    E-mail message of the notification for the resolved registrant, None
+    for registrants without e-mail address
+    """
+    if not employee or not employee["email"]:
+        return None
+    salut = " ".join([employee["salutation_short"], employee["firstname"], employee["lastname"]])
+    body = render_to_string('events/emails/notification.txt', {
+        'salutation': salut, 'message': notification.message})
+    return EmailMessage(SUBJECT, body, to=(employee["email"], ))
+
+
+def _send_over_connection(messages):
+    """
+    Send the messages one by one over a single mail connection. Returns the
+    error for every message (None when sent).
+    """
+    errors = []
+    connection = get_connection()
+    try:
+        for message in messages:
+            try:
+                connection.open()
+                connection.send_messages((message, ))
+            except Exception as error:  # pylint: disable=W0703
+                errors.append(error)
+                connection.close()   # the connection may be broken, the next message reopens it
+            else:
+                errors.append(None)
+    finally:
+        connection.close()
+    return errors
+
+
+def send_messages(messages, connections=MAIL_CONNECTIONS):
+    """
+    Send the messages over a small pool of reused mail connections.
+    Returns the error for every message (None when sent) in order.
+    """
+    messages = list(messages)
+    if not messages:
+        return []
+    connections = max(1, min(connections, len(messages)))
+    chunks = [messages[i::connections] for i in range(connections)]
+    if connections == 1:
+        results = [_send_over_connection(chunks[0])]
+    else:
+        pool = ThreadPool(connections)
+        try:
+            results = pool.map(_send_over_connection, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    errors = [None] * len(messages)
+    for offset, chunk_errors in enumerate(results):
+        errors[offset::connections] = chunk_errors
+    return errors
+
+
+def retry_later(notification, error):
+    """
+    Record the failed attempt and schedule the next one
+    """
+    Notification.objects.filter(pk=notification.pk).update(
+        attempts=notification.attempts + 1,
+        next_attempt=timezone.now() + RETRY_DELAY * 2 ** notification.attempts,
+        last_error=repr(error))
+
+
+def send_pending(batch_size=100):
+    """
+    Send all due notifications batch by batch. The recipients of a batch are
+    resolved at once and its messages are sent over reused mail connections.
+    Sent notifications are deleted, failed ones are retried later with
+    exponential backoff.
+    Returns the numbers of sent and failed notifications.
+    """
+    sent = failed = 0
+    while True:
+        batch = claim_batch(batch_size)
+        if not batch:
+            return sent, failed
+        try:
+            employees = resolver.resolve(notification.casy_ref for notification in batch)
+        except Exception as error:  # pylint: disable=W0703
+            for notification in batch:
+                retry_later(notification, error)
+            failed += len(batch)
+            continue
+        done = []
+        deliveries = []
+        for notification in batch:
+            message = render(notification, employees[notification.casy_ref])
+            if message is None:
+                done.append(notification.pk)
+            else:
+                deliveries.append((notification, message))
+        errors = send_messages([message for _, message in deliveries])
+        for (notification, _), error in zip(deliveries, errors):
+            if error is None:
+                sent += 1
+                done.append(notification.pk)
+            else:
+                failed += 1
+                retry_later(notification, error)
+        Notification.objects.filter(pk__in=done).delete()
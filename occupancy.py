@@ -0,0 +1,187 @@
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from mpi_intranet.events.conflicts import booked_events
+from mpi_intranet.events.models import Location, RoomOccupancy
+
+
+SLOT = timedelta(minutes=30)
+SLOT_SECONDS = 30 * 60
+SLOTS_PER_DAY = 48
+DAY = timedelta(days=1)
+
+# Hours of the day (local time) searched by find_free_slot
+OPENING_HOURS = getattr(settings, 'EVENTS_OPENING_HOURS', (8, 20))
+
+
+def local(value):
+    """
+    Naive local time of a datetime
+    """
+    if timezone.is_aware(value):
+        value = timezone.localtime(value).replace(tzinfo=None)
+    return value
+
+
+def aware(value):
+    """
+    Datetime of a naive local time, aware when time zones are used. Local
+    times skipped or repeated by daylight saving time changes are taken as
+    standard time (and moved to the time actually shown by the clock).
+    """
+    if settings.USE_TZ:
+        tz = timezone.get_current_timezone()
+        if hasattr(tz, 'localize'):
+            # pytz raises NonExistentTimeError / AmbiguousTimeError unless is_dst is given
+            return tz.normalize(tz.localize(value, is_dst=False))
+        return timezone.make_aware(value, tz)
+    return value
+
+
+def slot_count(delta, round_up=False):
+    """
+    Number of slots in a timedelta, the started one counted when round_up
+    """
+    seconds = int(delta.total_seconds())
+    if round_up:
+        return -(-seconds // SLOT_SECONDS)
+    return seconds // SLOT_SECONDS
+
+
+def slot_range(first, last):
+    """
+    Bits of the slots first to last - 1
+    """
+    return (1 << last) - (1 << first)
+
+
+def day_masks(start_date, end_date):
+    """
+    (day, slots) of the days between the dates, with the bits of the slots
+    overlapping [start_date, end_date)
+    """
+    start, end = local(start_date), local(end_date)
+    day = start.date()
+    while True:
+        midnight = datetime.combine(day, time())
+        first = slot_count(max(start, midnight) - midnight)
+        last = slot_count(min(end, midnight + DAY) - midnight, round_up=True)
+        if last > first:
+            yield day, slot_range(first, last)
+        day += DAY
+        if datetime.combine(day, time()) >= end:
+            return
+
+
+def day_slots(location_id, day):
+    """
+    Slots of the day booked in the room, computed from its events
+    """
+    midnight = datetime.combine(day, time())
+    events = booked_events().filter(location_name_int=location_id, end_date__gt=aware(midnight),
+                                    start_date__lt=aware(midnight + DAY))
+    slots = 0
+    for start_date, end_date in events.values_list('start_date', 'end_date'):
+        for event_day, mask in day_masks(start_date, end_date):
+            if event_day == day:
+                slots |= mask
+    return slots
+
+
+def update_occupancy(location_id, start_date, end_date):
+    """
+    Recompute the occupancy of the room for the days between the dates
+    """
+    if not location_id or start_date >= end_date:
+        return
+    with transaction.atomic():
+        for day, _mask in day_masks(start_date, end_date):
+            slots = day_slots(location_id, day)
+            if slots:
+                RoomOccupancy.objects.update_or_create(location_id=location_id, date=day,
+                                                       defaults={'slots': slots})
+            else:
+                RoomOccupancy.objects.filter(location_id=location_id, date=day).delete()
+
+
+def occupancy_masks(events):
+    """
+    Booked slots by (location id, day) of the events, given as (location id,
+    start date, end date) tuples
+    """
+    occupied = {}
+    for location_id, start_date, end_date in events:
+        for day, mask in day_masks(start_date, end_date):
+            occupied[location_id, day] = occupied.get((location_id, day), 0) | mask
+    return occupied
+
+
+def rebuild_occupancy():
+    """
+    Rebuild the occupancy of all rooms from the events
+    """
+    events = booked_events().values_list('location_name_int', 'start_date', 'end_date')
+    with transaction.atomic():
+        RoomOccupancy.objects.all().delete()
+        RoomOccupancy.objects.bulk_create([
+            RoomOccupancy(location_id=location_id, date=day, slots=slots)
+            for (location_id, day), slots in occupancy_masks(events.iterator()).items()], batch_size=1000)
+
+
+def week_occupancy(location_id, monday):
+    """
+    Booked slots of the room for the seven days starting with monday
+    """
+    occupied = dict(RoomOccupancy.objects.filter(
+        location=location_id, date__gte=monday, date__lt=monday + 7 * DAY).values_list('date', 'slots'))
+    return [(monday + offset * DAY, occupied.get(monday + offset * DAY, 0)) for offset in range(7)]
+
+
+def free_starts(slots, needed):
+    """
+    Bits of the slots starting a run of needed free slots. All slots of the
+    day are checked at once by shifting the free bits onto each other.
+    """
+    free = ~slots & slot_range(0, SLOTS_PER_DAY)
+    starts = free
+    for shift in range(1, needed):
+        starts &= free >> shift
+    return starts
+
+
+def find_free_slot(duration, after=None, days=14, locations=None, opening_hours=OPENING_HOURS):
+    """
+    Earliest room free for duration (timedelta) within the opening hours of
+    the next days, as a (location, start datetime) tuple, None when all rooms
+    are booked. The occupancy of all rooms is read in one query.
+    """
+    needed = slot_count(duration, round_up=True)
+    first_slot, last_slot = opening_hours[0] * 2, opening_hours[1] * 2
+    if needed < 1 or needed > last_slot - first_slot:
+        return None
+    after = local(after or timezone.now())
+    first_day = after.date()
+    if locations is None:
+        locations = Location.objects.order_by('name')
+    locations = list(locations)
+    occupied = dict(((location_id, day), slots) for location_id, day, slots in RoomOccupancy.objects.filter(
+        location__in=locations, date__gte=first_day, date__lt=first_day + days * DAY
+    ).values_list('location', 'date', 'slots'))
+    for offset in range(days):
+        day = first_day + offset * DAY
+        # runs must start and end within the opening hours, and not before 'after'
+        earliest = first_slot
+        if offset == 0:
+            earliest = max(earliest, slot_count(after - datetime.combine(day, time()), round_up=True))
+        allowed = slot_range(earliest, last_slot - needed + 1) if earliest <= last_slot - needed else 0
+        best = None
+        for location in locations:
+            starts = free_starts(occupied.get((location.pk, day), 0), needed) & allowed
+            if starts:
+                slot = (starts & -starts).bit_length() - 1
+                if best is None or slot < best[1]:
+                    best = (location, slot)
+        if best is not None:
+            return best[0], aware(datetime.combine(day, time()) + best[1] * SLOT)
+    return None
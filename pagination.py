@@ -0,0 +1,46 @@
+import json
+from django.core.paginator import Paginator
+from django.db import connections
+
+
+# Results estimated to be larger than this are not counted exactly
+ESTIMATE_THRESHOLD = 10000
+
+
+def estimate_count(queryset):
+    """
+    Number of rows of the queryset as estimated by the query planner, None
+    when the database can't tell (only PostgreSQL is supported)
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+    plan = cursor.fetchone()[0]
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def fast_count(queryset, threshold=ESTIMATE_THRESHOLD):
+    """
+    Estimated number of rows of the queryset if it is large, the exact number otherwise
+    """
+    estimate = estimate_count(queryset)
+    if estimate is not None and estimate > threshold:
+        return estimate
+    return queryset.count()
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that doesn't run COUNT(*) over large results, see fast_count
+    """
+
+    def _get_count(self):
+        if self._count is None:
+            self._count = fast_count(self.object_list)
+        return self._count
+    count = property(_get_count)
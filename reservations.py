@@ -0,0 +1,191 @@
+import csv
+from itertools import islice
+from django.db import transaction
+from django.db.models import F
+from mpi_intranet.events.caching import bump_version
+from mpi_intranet.events.employees import employee_name, resolver
+from mpi_intranet.events.models import Event, Notification, Reservation
+
+
+# Number of reservations inserted at once by import_reservations
+IMPORT_CHUNK_SIZE = 500
+
+# Number of registrants listed by deletion_preview
+PREVIEW_SAMPLE_SIZE = 20
+
+
+def lock_event(event_id):
+    """
+    Fetch the event and lock its row until the end of the transaction. All
+    changes of the reservations of an event are serialized on this lock.
+    """
+    return Event.objects.select_for_update().get(pk=event_id)
+
+
+def seats_for(event, kind):
+    """
+    Number of seats for the kind of reservations, None when not limited
+    """
+    if event.seats_available is None:
+        return None
+    if kind == Reservation.INTERNAL:
+        return event.seats_for_internals_only or 0
+    return event.seats_available - (event.seats_for_internals_only or 0)
+
+
+def free_seats(event, kind):
+    """
+    Number of seats that can still be confirmed, None when not limited
+    """
+    seats = seats_for(event, kind)
+    if seats is None:
+        return None
+    return max(seats - getattr(event, '%s_confirmed' % kind), 0)
+
+
+def register(event, casy_ref, kind, comment=''):
+    """
+    Register a person for the event. The reservation is confirmed if a seat
+    of its kind is free and nobody is waiting for one, otherwise the person
+    is put on the waiting list.
+    Returns the new reservation.
+    """
+    with transaction.atomic():
+        event = lock_event(event.pk)
+        free = free_seats(event, kind)
+        is_confirmed = free is None or free > 0 and not getattr(event, '%s_waiting' % kind)
+        reservation = Reservation(event=event, kind=kind, casy_ref=casy_ref,
+                                  is_confirmed=is_confirmed, comment=comment)
+        reservation.save()
+    return reservation
+
+
+def promote_waiting(event_id, kind):
+    """
+    Confirm the oldest waiting reservations of the kind while there are free
+    seats. Returns the promoted reservations.
+    """
+    with transaction.atomic():
+        event = lock_event(event_id)
+        free = free_seats(event, kind)
+        waiting = Reservation.objects.filter(event=event, kind=kind, is_confirmed=False).order_by('id')
+        if free is not None:
+            waiting = waiting[:free]
+        promoted = list(waiting)
+        for reservation in promoted:
+            reservation.is_confirmed = True
+            reservation.save()
+    return promoted
+
+
+def cancel_reservations(event, model):
+    """
+    Delete all reservations of the model (InternalReservation or
+    ExternalReservation) for the event in a single statement, reset the
+    matching event counters (stored and of the instance) and queue one notification run for the deleted
+    registrants. Per-object delete signals are not sent.
+    Returns the number of deleted reservations.
+    """
+    reservations = model.objects.filter(event=event)
+    if not reservations.exists():
+        return 0
+    with transaction.atomic():
+        lock_event(event.pk)
+        casy_refs = list(reservations.values_list('casy_ref', flat=True))
+        reservations._raw_delete(reservations.db)  # pylint: disable=W0212
+        counters = {
+            '%s_confirmed' % model.default_kind: 0,
+            '%s_waiting' % model.default_kind: 0}
+        Event.objects.filter(pk=event.pk).update(**counters)
+        for counter, value in counters.items():
+            setattr(event, counter, value)
+        Notification.enqueue(casy_refs, "Your registration has been deleted")
+    bump_version('reservations')
+    return len(casy_refs)
+
+
+def deletion_preview(event, event_type, sample_size=PREVIEW_SAMPLE_SIZE):
+    """
+    Reservations of the event deleted when its type is changed to event_type,
+    as a dictionary with the number of reservations and a sample of the
+    registrants (casymir reference and name) by kind
+    """
+    preview = {}
+    for kind, allowed in ((Reservation.INTERNAL, event_type.allow_internal_registrations),
+                          (Reservation.EXTERNAL, event_type.allow_external_registrations)):
+        count = getattr(event, '%s_confirmed' % kind) + getattr(event, '%s_waiting' % kind)
+        if allowed or not count:
+            continue
+        casy_refs = list(Reservation.objects.filter(event=event, kind=kind)
+                         .order_by('id').values_list('casy_ref', flat=True)[:sample_size])
+        employees = resolver.resolve(casy_refs)
+        preview[kind] = {
+            'count': count,
+            'sample': [{'casy_ref': casy_ref, 'name': employee_name(employees[casy_ref])}
+                       for casy_ref in casy_refs],
+        }
+    return preview
+
+
+def read_casy_refs(lines):
+    """
+    Casymir references from the first column of CSV lines. A header line and
+    empty lines are skipped, ValueError is raised for other invalid lines.
+    """
+    for number, row in enumerate(csv.reader(lines), 1):
+        if not row or not row[0].strip():
+            continue
+        try:
+            yield int(row[0])
+        except ValueError:
+            if number > 1:
+                raise ValueError('Line %d: invalid casymir reference %r' % (number, row[0]))
+
+
+def import_reservations(event, kind, casy_refs, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Register many people for the event at once, inserting the reservations
+    in chunks. People already registered (or listed twice) are skipped. The
+    free seats are confirmed in order, everybody else is put on the waiting
+    list. Signals are not sent, the registrants are notified in bulk.
+    Returns the numbers of confirmed, waiting and skipped registrants.
+    """
+    allowed = event.type.allow_internal_registrations if kind == Reservation.INTERNAL else \
+        event.type.allow_external_registrations
+    if not allowed:
+        raise ValueError('The event type does not allow %s registrations' % kind)
+    casy_refs = iter(casy_refs)
+    confirmed = waiting = skipped = 0
+    with transaction.atomic():
+        event = lock_event(event.pk)
+        registered = set(Reservation.objects.filter(event=event, kind=kind).values_list('casy_ref', flat=True))
+        free = free_seats(event, kind)
+        if getattr(event, '%s_waiting' % kind):
+            free = 0    # nobody passes people already waiting
+        while True:
+            chunk = list(islice(casy_refs, chunk_size))
+            if not chunk:
+                break
+            reservations = []
+            for casy_ref in chunk:
+                if casy_ref in registered:
+                    skipped += 1
+                    continue
+                registered.add(casy_ref)
+                is_confirmed = free is None or confirmed < free
+                reservations.append(Reservation(event=event, kind=kind, casy_ref=casy_ref,
+                                                is_confirmed=is_confirmed, comment=''))
+                if is_confirmed:
+                    confirmed += 1
+                else:
+                    waiting += 1
+            Reservation.objects.bulk_create(reservations)
+            for is_confirmed in (True, False, ):
+                Notification.enqueue(
+                    [reservation.casy_ref for reservation in reservations if reservation.is_confirmed == is_confirmed],
+                    "You have new registration with status %s" % ("Confirmed" if is_confirmed else "Waiting", ))
+        Event.objects.filter(pk=event.pk).update(**{
+            '%s_confirmed' % kind: F('%s_confirmed' % kind) + confirmed,
+            '%s_waiting' % kind: F('%s_waiting' % kind) + waiting})
+    bump_version('reservations')
+    return confirmed, waiting, skipped
@@ -0,0 +1,94 @@
+import re
+from collections import Counter
+from django.db import connection
+from django.utils.html import strip_tags
+from django.utils.text import unescape_entities
+from mpi_intranet.events.models import Event, SearchTerm
+
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Text search configuration used for the PostgreSQL full-text index (events are multilingual)
+TS_CONFIG = 'simple'
+
+
+def uses_full_text():
+    """
+    Whether the database provides full-text search, otherwise the SearchTerm
+    inverted index is used
+    """
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(text):
+    """
+    Lowercased words of the text
+    """
+    return [word.lower()[:64] for word in WORD_RE.findall(text)]
+
+
+def build_document(parts):
+    """
+    Plain text search document of the given (HTML) texts, entities are
+    replaced with their characters
+    """
+    return '\n'.join(unescape_entities(strip_tags(part)) for part in parts if part)
+
+
+def index_event(event):
+    """
+    Rebuild the search document of the event (title, topic, descriptions
+    and speaker biographies) and, without full-text search, its search terms.
+    Nothing is written when the document hasn't changed.
+    """
+    document = build_document([event.title, event.topic, event.short_description, event.full_description] +
+                              list(event.speakers.values_list('bio', flat=True)))
+    if document == event.search_document:
+        return
+    Event.objects.filter(pk=event.pk).update(search_document=document)
+    event.search_document = document
+    if not uses_full_text():
+        SearchTerm.objects.filter(event=event).delete()
+        SearchTerm.objects.bulk_create([
+            SearchTerm(event=event, term=term, occurrences=occurrences)
+            for term, occurrences in Counter(tokenize(document)).items()])
+
+
+def index_copies(event, copies):
+    """
+    Index copies of the event (same texts and speakers) created with
+    bulk_create, their search documents have been copied with the event
+    """
+    if uses_full_text():
+        return
+    terms = list(SearchTerm.objects.filter(event=event).values_list('term', 'occurrences'))
+    SearchTerm.objects.bulk_create([
+        SearchTerm(event=copy, term=term, occurrences=occurrences)
+        for copy in copies for term, occurrences in terms])
+
+
+def search_events(queryset, search_term):
+    """
+    Events of the queryset matching all words of the search term, annotated
+    with their 'search_rank'
+    """
+    if uses_full_text():
+        tsvector = "to_tsvector('%s', events_event.search_document)" % TS_CONFIG
+        tsquery = "plainto_tsquery('%s', %%s)" % TS_CONFIG
+        return queryset.extra(
+            select={'search_rank': 'ts_rank(%s, %s)' % (tsvector, tsquery)},
+            select_params=(search_term, ),
+            where=['%s @@ %s' % (tsvector, tsquery)],
+            params=(search_term, ))
+    terms = tokenize(search_term)
+    if not terms:
+        # nothing to search for, still provide the rank to order by
+        return queryset.none().extra(select={'search_rank': '0'})
+    for term in terms:
+        queryset = queryset.filter(pk__in=SearchTerm.objects.filter(term__startswith=term).values('event'))
+    return queryset.extra(
+        select={'search_rank': """
+            SELECT SUM(occurrences) FROM events_searchterm
+                WHERE events_searchterm.event_id=events_event.id AND (%s)
+        """ % ' OR '.join(['events_searchterm.term LIKE %s'] * len(terms))},
+        select_params=['%s%%' % term for term in terms])
@@ -0,0 +1,185 @@
+from datetime import datetime, time, timedelta
+from itertools import islice
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from mpi_intranet.events.caching import bump_version
+from mpi_intranet.events.models import Attachment, Event, EventSeries
+from mpi_intranet.events.occupancy import aware, local, update_occupancy
+from mpi_intranet.events.reservations import register
+from mpi_intranet.events.search import index_copies
+
+
+# How far ahead occurrences are listed (series may not end)
+LISTING_HORIZON = timedelta(days=365)
+
+# Fields of the template event not copied to the occurrences
+NOT_COPIED = ('id', 'start_date', 'end_date', 'series', 'series_start', 'modified',
+              'internal_confirmed', 'internal_waiting', 'external_confirmed', 'external_waiting', )
+
+
+def add_months(value, months):
+    """
+    The datetime months later, None when the day doesn't exist in that month
+    """
+    years, month = divmod(value.month - 1 + months, 12)
+    try:
+        return value.replace(year=value.year + years, month=month + 1)
+    except ValueError:
+        return None
+
+
+def occurrence_dates(series, start, end):
+    """
+    Start dates of the occurrences of the series starting from start (the
+    first one when None) and before end. Dates are generated in local time from the series start of
+    the template (kept when the template is moved), so that occurrences
+    keep their time of the day across daylight saving time changes.
+    """
+    template = series.template
+    first = local(template.series_start or template.start_date)
+    start = local(start) if start is not None else first
+    end = local(end)
+    if series.until is not None:
+        end = min(end, datetime.combine(series.until + timedelta(days=1), time()))
+    if series.frequency == EventSeries.MONTHLY:
+        # skip the months before the window
+        index = max(0, ((start.year - first.year) * 12 + start.month - first.month - 1) // series.interval)
+        while True:
+            date = add_months(first, index * series.interval)
+            index += 1
+            if date is None:
+                continue
+            if date >= end:
+                return
+            if date >= start:
+                yield aware(date)
+    else:
+        step = timedelta(days=series.interval * (7 if series.frequency == EventSeries.WEEKLY else 1))
+        # jump to the first occurrence of the window
+        index = max(0, -(-int((start - first).total_seconds()) // int(step.total_seconds())))
+        date = first + index * step
+        while date < end:
+            yield aware(date)
+            date += step
+
+
+def build_occurrence(series, series_start):
+    """
+    Unsaved event of the occurrence of the series starting at series_start
+    """
+    template = series.template
+    values = dict((field.attname, getattr(template, field.attname))
+                  for field in Event._meta.concrete_fields if field.name not in NOT_COPIED)
+    return Event(series=series, series_start=series_start, start_date=series_start,
+                 end_date=series_start + (template.end_date - template.start_date), **values)
+
+
+def occurrences(series, start, end):
+    """
+    Events of the occurrences starting in the window, stored ones and
+    unsaved ones generated from the template for the others
+    """
+    stored = dict((event.series_start, event) for event in Event.objects.filter(
+        series=series, series_start__gte=start, series_start__lt=end))
+    return [stored.get(series_start) or build_occurrence(series, series_start)
+            for series_start in occurrence_dates(series, start, end)]
+
+
+def listed_series():
+    """
+    Series whose occurrences are listed, the ones with an active template
+    that haven't ended. The template relations shown in the listings are
+    fetched along.
+    """
+    return EventSeries.objects.filter(template__is_active=True)\
+        .filter(Q(until__isnull=True) | Q(until__gte=local(timezone.now()).date()))\
+        .select_related('template__type', 'template__location_name_int')\
+        .prefetch_related('template__speakers')
+
+
+def generated_occurrences(series_list, start, end, limit=None):
+    """
+    Unsaved events of the occurrences of the series starting in the window
+    (from the first occurrence when start is None) that haven't been stored,
+    at most limit per series, ordered by start date. They share the type,
+    location and speakers of their template.
+    """
+    series_list = list(series_list)
+    stored = Event.objects.filter(series__in=series_list, series_start__lt=end)
+    if start is not None:
+        stored = stored.filter(series_start__gte=start)
+    stored = set(stored.values_list('series', 'series_start'))
+    events = []
+    for series in series_list:
+        template = series.template
+        series_starts = (series_start for series_start in occurrence_dates(series, start, end)
+                         if (series.pk, series_start) not in stored)
+        for series_start in islice(series_starts, limit):
+            event = build_occurrence(series, series_start)
+            event.type = template.type
+            event.location_name_int = template.location_name_int
+            event.modified = template.modified
+            events.append(event)
+    events.sort(key=lambda event: (event.start_date, -event.series_id))
+    return events
+
+
+def materialize(series, series_starts):
+    """
+    Store the occurrences of the series starting at the dates as events with
+    bulk_create, in one transaction. The speakers and attachments of the
+    template are copied, the new events are indexed for search and booked in
+    their room. Returns the events of the occurrences (stored ones included)
+    by start date, ValueError is raised for dates not in the series.
+    """
+    series_starts = set(series_starts)
+    if not series_starts:
+        return {}
+    with transaction.atomic():
+        series = EventSeries.objects.select_for_update().select_related('template').get(pk=series.pk)
+        template = series.template
+        events = dict((event.series_start, event) for event in Event.objects.filter(
+            series=series, series_start__in=series_starts))
+        missing = series_starts.difference(events)
+        if not missing:
+            return events
+        valid = set(occurrence_dates(series, min(missing), max(missing) + timedelta(seconds=1)))
+        if not missing.issubset(valid):
+            raise ValueError('Not an occurrence of the series: %s' % ', '.join(
+                str(local(date)) for date in sorted(missing.difference(valid))))
+        new_events = [build_occurrence(series, series_start) for series_start in sorted(missing)]
+        for event in new_events:
+            event.location_name_int = template.location_name_int
+            event.update_sort_keys()
+        Event.objects.bulk_create(new_events)
+        # bulk_create doesn't set the primary keys
+        created = list(Event.objects.filter(series=series, series_start__in=missing))
+        speaker_ids = list(template.speakers.values_list('pk', flat=True))
+        Event.speakers.through.objects.bulk_create([
+            Event.speakers.through(event_id=event.pk, speaker_id=speaker_id)
+            for event in created for speaker_id in speaker_ids])
+        attachments = list(template.attachments.values_list('title', 'file'))
+        Attachment.objects.bulk_create([
+            Attachment(event=event, title=title, file_id=file_id)
+            for event in created for title, file_id in attachments])
+        index_copies(template, created)
+        for event in created:
+            update_occupancy(event.location_name_int_id, event.start_date, event.end_date)
+    bump_version('events')
+    events.update((event.series_start, event) for event in created)
+    return events
+
+
+def get_occurrence(series, series_start):
+    """
+    Event of the occurrence of the series starting at series_start, stored if needed
+    """
+    return materialize(series, (series_start, ))[series_start]
+
+
+def register_occurrence(series, series_start, casy_ref, kind, comment=''):
+    """
+    Register for an occurrence of the series, see reservations.register
+    """
+    return register(get_occurrence(series, series_start), casy_ref, kind, comment)
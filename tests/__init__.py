@@ -0,0 +1,24 @@
+from datetime import timedelta
+from django.utils import timezone
+from mpi_intranet.events.models import Event, EventType
+
+
+def create_event_type(**kwargs):
+    values = {'name': 'seminar', 'title': 'Seminar'}
+    values.update(kwargs)
+    return EventType.objects.create(**values)
+
+
+def create_event(event_type=None, **kwargs):
+    """
+    Saved event starting tomorrow, with 10 seats of which 5 for internals
+    """
+    start_date = timezone.now() + timedelta(days=1)
+    values = {
+        'title': 'Event', 'type': event_type or create_event_type(), 'start_date': start_date,
+        'end_date': start_date + timedelta(hours=2), 'is_inhouse': False, 'location_name_ext': 'Kirchberg',
+        'full_description': '<p>Event</p>', 'casy_ref': 1, 'seats_available': 10,
+        'seats_for_internals_only': 5,
+    }
+    values.update(kwargs)
+    return Event.objects.create(**values)
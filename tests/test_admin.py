@@ -0,0 +1,66 @@
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from mpi_intranet.events.models import Location, Speaker
+from mpi_intranet.events.tests import create_event, create_event_type
+
+
+class EventChangelistTest(TestCase):
+    """
+    The number of queries of the event changelist doesn't depend on the
+    number of events displayed
+    """
+
+    def setUp(self):
+        get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        self.event_type = create_event_type(has_speakers=True)
+        self.location = Location.objects.create(name='Room 245')
+        self.speakers = [Speaker.objects.create(casy_ref=casy_ref, bio='Speaker %d' % casy_ref)
+                         for casy_ref in range(3)]
+        self.url = reverse('admin:events_event_changelist')
+
+    def add_events(self, count):
+        for number in range(count):
+            event = create_event(self.event_type, title='Event %d' % number, is_inhouse=number % 2 == 0,
+                                 location_name_int=self.location if number % 2 == 0 else None)
+            event.speakers.add(*self.speakers)
+
+    def changelist_queries(self):
+        # the first request fills the cached filter choices
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count(self):
+        self.add_events(1)
+        queries = self.changelist_queries()
+        self.add_events(20)
+        self.assertEqual(self.changelist_queries(), queries)
+        with self.assertNumQueries(queries):
+            self.client.get(self.url)
+
+
+class ReservationChangelistTest(TestCase):
+    """
+    The reservation changelist estimates its counts, with and without filters
+    """
+
+    def setUp(self):
+        get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        self.event = create_event()
+        for casy_ref in range(3):
+            self.event.internal_reservations.create(casy_ref=casy_ref, is_confirmed=casy_ref < 2)
+        self.url = reverse('admin:events_internalreservation_changelist')
+
+    def test_filters(self):
+        for params, count in (({}, 3), ({'is_confirmed__exact': 1}, 2), ({'event': self.event.pk}, 3)):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['cl'].result_count, count)
+            self.assertEqual(response.context['cl'].full_result_count, 3)
@@ -0,0 +1,29 @@
+from django.test import SimpleTestCase
+from mpi_intranet.events.ical import fold
+
+
+class FoldTest(SimpleTestCase):
+
+    def assertFolded(self, line):
+        folded = fold(line)
+        self.assertTrue(folded.endswith('\r\n'))
+        lines = folded[:-2].split('\r\n')
+        for folded_line in lines:
+            self.assertLessEqual(len(folded_line.encode('utf-8')), 75)
+        for folded_line in lines[1:]:
+            self.assertTrue(folded_line.startswith(' '))
+        self.assertEqual(lines[0] + ''.join(folded_line[1:] for folded_line in lines[1:]), line)
+        return lines
+
+    def test_short_line(self):
+        self.assertEqual(fold('SUMMARY:Seminar'), 'SUMMARY:Seminar\r\n')
+
+    def test_ascii_line(self):
+        lines = self.assertFolded('DESCRIPTION:' + 'x' * 200)
+        self.assertEqual(len(lines[0]), 75)
+
+    def test_multi_octet_characters(self):
+        # two octet characters straddle the 75 octet boundary
+        self.assertFolded(u'SUMMARY:' + u'\u00e9' * 100)
+        # three and four octet characters
+        self.assertFolded(u'SUMMARY:x' + u'\u20ac' * 60 + u'\U0001f4c5' * 30)
@@ -0,0 +1,86 @@
+from datetime import timedelta
+from smtplib import SMTPRecipientsRefused
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from mpi_intranet.events import notifications
+from mpi_intranet.events.models import Notification
+
+
+EMPLOYEES = {
+    1: {'salutation_short': 'Dr.', 'firstname': 'Ada', 'lastname': 'Lovelace', 'email': 'ada@example.com'},
+    2: {'salutation_short': 'Mr.', 'firstname': 'Alan', 'lastname': 'Turing', 'email': 'alan@example.com'},
+    3: {'salutation_short': 'Ms.', 'firstname': 'Grace', 'lastname': 'Hopper', 'email': 'refused@example.com'},
+    4: {'salutation_short': 'Mr.', 'firstname': 'No', 'lastname': 'Mail', 'email': ''},
+}
+
+
+class StaticResolver(object):
+    """
+    Resolves the casymir references of EMPLOYEES without casymir
+    """
+
+    @staticmethod
+    def resolve(casy_refs):
+        return dict((casy_ref, EMPLOYEES.get(casy_ref)) for casy_ref in casy_refs)
+
+
+class RefusingEmailBackend(EmailBackend):
+    """
+    Memory backend refusing the messages to refused@example.com
+    """
+
+    def send_messages(self, messages):
+        for message in messages:
+            if 'refused@example.com' in message.to:
+                raise SMTPRecipientsRefused({'refused@example.com': (550, 'User unknown')})
+        return super(RefusingEmailBackend, self).send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class SendPendingTest(TestCase):
+
+    def setUp(self):
+        self.resolver = notifications.resolver
+        notifications.resolver = StaticResolver()
+
+    def tearDown(self):
+        notifications.resolver = self.resolver
+
+    def test_claimed_notifications_are_sent(self):
+        Notification.enqueue((1, 2, 4, 5), 'Dates of the event have been changed')
+        self.assertEqual(notifications.send_pending(batch_size=2), (2, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['ada@example.com', 'alan@example.com'])
+        self.assertIn('Dates of the event have been changed', mail.outbox[0].body)
+        # registrants without e-mail address are skipped, not retried
+        self.assertFalse(Notification.objects.exists())
+
+    def test_not_due_notifications_are_not_claimed(self):
+        Notification.enqueue((1, ), 'Later')
+        Notification.objects.update(next_attempt=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(notifications.send_pending(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(EMAIL_BACKEND='mpi_intranet.events.tests.test_notifications.RefusingEmailBackend')
+    def test_failed_recipients_are_retried_with_backoff(self):
+        Notification.enqueue((1, 2, 3), 'This event has been canceled')
+        before = timezone.now()
+        self.assertEqual(notifications.send_pending(), (2, 1))
+        self.assertEqual(len(mail.outbox), 2)
+        failed = Notification.objects.get()
+        self.assertEqual(failed.casy_ref, 3)
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('SMTPRecipientsRefused', failed.last_error)
+        self.assertGreaterEqual(failed.next_attempt, before + notifications.RETRY_DELAY)
+
+        # not due yet
+        self.assertEqual(notifications.send_pending(), (0, 0))
+
+        Notification.objects.update(next_attempt=timezone.now())
+        before = timezone.now()
+        self.assertEqual(notifications.send_pending(), (0, 1))
+        failed = Notification.objects.get()
+        self.assertEqual(failed.attempts, 2)
+        self.assertGreaterEqual(failed.next_attempt, before + notifications.RETRY_DELAY * 2)
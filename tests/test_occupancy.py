@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+from django.core import serializers
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from mpi_intranet.events.models import Location, RoomOccupancy
+from mpi_intranet.events.occupancy import aware, local
+from mpi_intranet.events.tests import create_event
+
+
+class OccupancyTest(TestCase):
+
+    def setUp(self):
+        self.room = Location.objects.create(name='Room 245')
+        self.other_room = Location.objects.create(name='Room 246')
+        self.event = create_event(is_inhouse=True, location_name_int=self.room)
+
+    def assertBooked(self, location, booked=True):
+        self.assertEqual(RoomOccupancy.objects.filter(location=location).exists(), booked)
+
+    def test_move(self):
+        self.assertBooked(self.room)
+        self.event.location_name_int = self.other_room
+        self.event.save()
+        self.assertBooked(self.room, False)
+        self.assertBooked(self.other_room)
+
+    def test_raw_save(self):
+        # as reverting a version or loading a fixture does
+        stored = serializers.serialize('json', [self.event])
+        self.event.location_name_int = self.other_room
+        self.event.save()
+        for deserialized in serializers.deserialize('json', stored):
+            deserialized.save()
+        self.assertBooked(self.room)
+        self.assertBooked(self.other_room, False)
+
+
+@override_settings(USE_TZ=True)
+class DaylightSavingTimeTest(SimpleTestCase):
+
+    def test_skipped_time(self):
+        with timezone.override('Europe/Luxembourg'):
+            self.assertEqual(local(aware(datetime(2026, 3, 29, 2, 30))), datetime(2026, 3, 29, 3, 30))
+
+    def test_repeated_time(self):
+        with timezone.override('Europe/Luxembourg'):
+            self.assertEqual(aware(datetime(2026, 10, 25, 2, 30)).utcoffset(), timedelta(hours=1))
@@ -0,0 +1,38 @@
+from datetime import timedelta
+from unittest import skipUnless
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from mpi_intranet.events.management.commands.check_query_plans import explain, hot_queries, scans_table
+from mpi_intranet.events.models import Event, Reservation
+from mpi_intranet.events.tests import create_event, create_event_type
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'Query plans are only checked on SQLite and PostgreSQL')
+class QueryPlanTest(TestCase):
+    """
+    The changelist filters and the capacity checks must be served by indexes
+    """
+
+    def setUp(self):
+        event_type = create_event_type()
+        now = timezone.now()
+        for number in range(50):
+            create_event(event_type, title='Event %d' % number, start_date=now + timedelta(days=number - 25),
+                         end_date=now + timedelta(days=number - 25, hours=2), is_active=number % 5 != 0,
+                         location_name_ext='Location %d' % (number % 7))
+        Reservation.objects.bulk_create([
+            Reservation(event=event, kind=kind, casy_ref=casy_ref, is_confirmed=casy_ref % 3 != 0, comment='')
+            for event in Event.objects.all()
+            for kind in (Reservation.INTERNAL, Reservation.EXTERNAL)
+            for casy_ref in range(20)])
+        cursor = connection.cursor()
+        cursor.execute('ANALYZE')
+        if connection.vendor == 'postgresql':
+            # the planner prefers sequential scans on small tables, only check that an index can be used
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def test_hot_queries_use_indexes(self):
+        for name, table, queryset in hot_queries():
+            plan = explain(queryset)
+            self.assertFalse(scans_table(plan, table), '%s scans %s:\n  %s' % (name, table, '\n  '.join(plan)))
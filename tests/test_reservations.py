@@ -0,0 +1,58 @@
+import threading
+from django.db import connection
+from django.test import TransactionTestCase, skipUnlessDBFeature
+from mpi_intranet.events.models import Event, Reservation
+from mpi_intranet.events.reservations import register
+from mpi_intranet.events.tests import create_event
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class RegisterConcurrencyTest(TransactionTestCase):
+    """
+    Concurrent registrations for one event, every thread has its own
+    database connection
+    """
+
+    registrants = 30
+
+    def setUp(self):
+        self.event = create_event(seats_available=10, seats_for_internals_only=5)
+
+    def register_all(self, casy_refs):
+        errors = []
+
+        def register_one(casy_ref):
+            try:
+                register(self.event, casy_ref, Reservation.INTERNAL)
+            except Exception as error:  # pylint: disable=W0703
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=register_one, args=(casy_ref, )) for casy_ref in casy_refs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_no_overbooking(self):
+        self.register_all(range(1, self.registrants + 1))
+        event = Event.objects.get(pk=self.event.pk)
+        self.assertEqual(event.internal_confirmed, 5)
+        self.assertEqual(event.internal_waiting, self.registrants - 5)
+        self.assertEqual(Reservation.objects.counts(), {
+            (event.pk, Reservation.INTERNAL, True): 5,
+            (event.pk, Reservation.INTERNAL, False): self.registrants - 5})
+
+    def test_waiting_list_promoted_in_order(self):
+        self.register_all(range(1, self.registrants + 1))
+        waiting = list(Reservation.objects.filter(event=self.event, is_confirmed=False)
+                       .order_by('id').values_list('pk', flat=True))
+        for reservation in Reservation.objects.filter(event=self.event, is_confirmed=True).order_by('id')[:2]:
+            reservation.delete()
+        promoted = Reservation.objects.filter(pk__in=waiting, is_confirmed=True)
+        self.assertEqual(sorted(promoted.values_list('pk', flat=True)), waiting[:2])
+        event = Event.objects.get(pk=self.event.pk)
+        self.assertEqual(event.internal_confirmed, 5)
+        self.assertEqual(event.internal_waiting, self.registrants - 7)
@@ -3,5 +3,15 @@ from django.conf.urls import url
 urlpatterns = [
     url(r'^event_type/(?P<event_type_id>\d+)/',
         'mpi_intranet.events.views.get_event_type', name='event_type'),
+    url(r'^event_types/$',
+        'mpi_intranet.events.views.event_types', name='event_types'),
+    url(r'^upcoming/$',
+        'mpi_intranet.events.views.upcoming_events', name='upcoming_events'),
+    url(r'^calendar\.ics$',
+        'mpi_intranet.events.views.calendar_feed', name='calendar'),
+    url(r'^calendar/type/(?P<event_type_id>\d+)\.ics$',
+        'mpi_intranet.events.views.calendar_feed', name='calendar_event_type'),
+    url(r'^calendar/location/(?P<location_id>\d+)\.ics$',
+        'mpi_intranet.events.views.calendar_feed', name='calendar_location'),
     url(r'^', 'mpi_intranet.events.views.events', name='events')
 ]
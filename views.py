@@ -1,7 +1,38 @@
+import base64
+import binascii
+import json
+from datetime import timedelta
 from django.shortcuts import render
 from mpi_intranet.base.authentication import login_required
-from django.http import JsonResponse
-from mpi_intranet.events.models import EventType
+from django.db.models import Count, Max, Q
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from mpi_intranet.events.caching import get_cached, get_modified, get_version
+from mpi_intranet.events.ical import calendar
+from mpi_intranet.events.models import Event, EventType, Location, Reservation
+from mpi_intranet.events.reservations import free_seats
+from mpi_intranet.events.series import LISTING_HORIZON, generated_occurrences, listed_series
+
+
+# JSON map of the event type flags by version, see event_types
+_event_types_json = {}
+
+# How long browsers may reuse the event type map before revalidating it
+EVENT_TYPES_MAX_AGE = 300
+
+# How far back the calendar lists the occurrences of event series that haven't been stored
+CALENDAR_HISTORY = timedelta(days=365)
+
+# Page sizes of the upcoming events API
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# How long a page of upcoming events is cached (events become past while cached)
+UPCOMING_EVENTS_TIMEOUT = 60
 
 
 @login_required
@@ -28,3 +59,197 @@ def get_event_type(request, event_type_id):     # pylint: disable=W0613
             "allow_external_registrations": True,
             "has_speakers": False,
             "has_topic": False})
+
+
+def _build_event_types_json():
+    return json.dumps(dict(
+        (event_type.pk, {
+            "allow_internal_registrations": event_type.allow_internal_registrations,
+            "allow_external_registrations": event_type.allow_external_registrations,
+            "has_speakers": event_type.has_speakers,
+            "has_topic": event_type.has_topic})
+        for event_type in EventType.objects.filter(is_active=True)))
+
+
+def _event_types_etag(request):     # pylint: disable=W0613
+    return 'event-types-%s' % get_version('event_types')
+
+
+def _event_types_modified(request):     # pylint: disable=W0613
+    return get_modified('event_types')
+
+
+@cache_control(private=True, max_age=EVENT_TYPES_MAX_AGE)
+@condition(etag_func=_event_types_etag, last_modified_func=_event_types_modified)
+def event_types(request):
+    """
+    Returns the options of all active event types (see get_event_type) by id.
+    The map is versioned and cached, browsers reuse it for EVENT_TYPES_MAX_AGE
+    seconds and unchanged maps are answered with 304 afterwards.
+    """
+    version = get_version('event_types')
+    payload = _event_types_json.get(version)
+    if payload is None:
+        payload = get_cached('event_types', 'json', _build_event_types_json)
+        _event_types_json.clear()
+        _event_types_json[version] = payload
+    return HttpResponse(payload, content_type='application/json')
+
+
+def position(event):
+    """
+    (start_date, id) position of the event in the listings. Generated
+    occurrences of a series have no id yet, they are told apart by minus the
+    id of their series.
+    """
+    return event.start_date, event.pk or -event.series_id
+
+
+def merge_occurrences(events, occurrences):
+    """
+    Merge generated occurrences into events, both in the listings order
+    """
+    occurrences = iter(occurrences)
+    pending = next(occurrences, None)
+    for event in events:
+        while pending is not None and position(pending) < position(event):
+            yield pending
+            pending = next(occurrences, None)
+        yield event
+    if pending is not None:
+        yield pending
+    for occurrence in occurrences:
+        yield occurrence
+
+
+def encode_cursor(event):
+    """
+    Opaque position after the event in the (start_date, id) order
+    """
+    start_date, pk = position(event)
+    return base64.urlsafe_b64encode(('%s|%s' % (start_date.isoformat(), pk)).encode('utf-8'))
+
+
+def decode_cursor(cursor):
+    """
+    Start date and id encoded by encode_cursor, ValueError for invalid cursors
+    """
+    try:
+        start_date, pk = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+    except (TypeError, UnicodeError, binascii.Error):
+        raise ValueError(cursor)
+    start_date = parse_datetime(start_date)
+    if start_date is None:
+        raise ValueError(cursor)
+    return start_date, int(pk)
+
+
+def _upcoming_events_page(cursor, limit):
+    start = timezone.now()
+    events = Event.objects.filter(is_active=True, start_date__gte=start)\
+        .select_related('type', 'location_name_int')\
+        .prefetch_related('speakers')\
+        .order_by('start_date', 'id')
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        start = max(start, after[0])
+        events = events.filter(Q(start_date__gt=after[0]) | Q(start_date=after[0], id__gt=after[1]))
+    events = list(events[:limit + 1])
+    # occurrences of series up to the last stored event of the page
+    end = events[limit].start_date + timedelta(seconds=1) if len(events) > limit else timezone.now() + LISTING_HORIZON
+    occurrences = [occurrence for occurrence in generated_occurrences(listed_series(), start, end, limit + 1)
+                   if after is None or position(occurrence) > after]
+    events = list(merge_occurrences(events, occurrences))[:limit + 1]
+    return {
+        "events": [{
+            "id": event.pk,
+            "series": event.series_id,
+            "series_start": event.series_start.isoformat() if event.series_start else None,
+            "title": event.title,
+            "type": event.type.title,
+            "topic": event.topic,
+            "start_date": event.start_date.isoformat(),
+            "end_date": event.end_date.isoformat(),
+            "location": event.location_full,
+            "short_description": event.short_description,
+            "speakers": [{"casy_ref": speaker.casy_ref, "bio": speaker.bio}
+                         for speaker in (event if event.pk else event.series.template).speakers.all()],
+            "free_seats": {
+                "internal": free_seats(event, Reservation.INTERNAL),
+                "external": free_seats(event, Reservation.EXTERNAL)},
+        } for event in events[:limit]],
+        "next": encode_cursor(events[limit - 1]) if len(events) > limit else None}
+
+
+@login_required
+def upcoming_events(request):
+    """
+    Returns a page of upcoming active events ordered by start date. Pass the
+    'next' value of a page as 'after' to get the following page. Occurrences
+    of event series that haven't been stored yet have no id, they are
+    identified by their series and series_start.
+    """
+    cursor = request.GET.get('after', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError:
+        return JsonResponse({"error": "Invalid 'after' or 'limit'"}, status=400)
+    page = get_cached('events', 'upcoming:%s:%s:%s' % (get_version('reservations'), cursor, limit),
+                      lambda: _upcoming_events_page(cursor, limit), UPCOMING_EVENTS_TIMEOUT)
+    return JsonResponse(page)
+
+
+def _calendar_events(event_type_id=None, location_id=None):
+    events = Event.objects.all()
+    if event_type_id is not None:
+        events = events.filter(type=event_type_id)
+    if location_id is not None:
+        events = events.filter(is_inhouse=True, location_name_int=location_id)
+    return events
+
+
+def _calendar_series(event_type_id=None, location_id=None):
+    series = listed_series()
+    if event_type_id is not None:
+        series = series.filter(template__type=event_type_id)
+    if location_id is not None:
+        series = series.filter(template__is_inhouse=True, template__location_name_int=location_id)
+    return series
+
+
+def _calendar_etag(request, event_type_id=None, location_id=None):     # pylint: disable=W0613
+    state = _calendar_events(event_type_id, location_id).aggregate(modified=Max('modified'), count=Count('id'))
+    # generated occurrences change with the series ('events' version) and move ahead every day
+    return 'calendar-%s-%s-%s-%s' % (state['modified'].isoformat() if state['modified'] else '', state['count'],
+                                     get_version('events'), timezone.now().date().isoformat())
+
+
+@login_required
+@condition(etag_func=_calendar_etag)
+def calendar_feed(request, event_type_id=None, location_id=None):
+    """
+    Returns all events (of an event type or at an inhouse location) and the
+    occurrences of event series from a year ago until a year from now as
+    iCalendar. The calendar is streamed, unchanged calendars are answered
+    with 304.
+    """
+    name = 'MPI Events'
+    if event_type_id is not None:
+        name = '%s: %s' % (name, get_object_or_404(EventType, pk=event_type_id).title)
+    if location_id is not None:
+        name = '%s: %s' % (name, get_object_or_404(Location, pk=location_id).name)
+    events = _calendar_events(event_type_id, location_id)\
+        .select_related('location_name_int')\
+        .defer('full_description', 'notes', 'search_document')\
+        .order_by('start_date', 'id')
+    now = timezone.now()
+    occurrences = generated_occurrences(_calendar_series(event_type_id, location_id), now - CALENDAR_HISTORY,
+                                        now + LISTING_HORIZON)
+    response = StreamingHttpResponse(calendar(merge_occurrences(events.iterator(), occurrences), name,
+                                              request.get_host()),
+                                     content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = 'inline; filename="events.ics"'
+    return response